@@ -0,0 +1,175 @@
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Контроль нагрузки на уровне диспетчера (outer middleware на dp.update).
+# Одновременно обрабатывается не больше max_inflight апдейтов, остальные ждут
+# в очереди с приоритетом не дольше deadline секунд. При перегрузке первыми
+# отбрасываются апдейты низкой ценности (навигация по меню), а платёжный поток
+# (чеки, подтверждение/отклонение админом) проходит вперёд очереди.
+# Высокий приоритет выдаётся пользователю не чаще high_per_user раз за
+# high_window секунд (кроме доверенных, т.е. админа): спам картинками во время
+# пика уходит в обычную очередь и не вытесняет настоящие платежи.
+
+HIGH, NORMAL, LOW = 0, 1, 2
+PRIORITY_NAMES = {HIGH: "high", NORMAL: "normal", LOW: "low"}
+
+# переходы по меню: повторяются пачками и ничего не меняют
+LOW_VALUE_CALLBACKS = {"start_back", "buy_open"}
+PAYMENT_CALLBACK_PREFIXES = ("admin_approve_", "admin_deny_", "cancel_pending")
+
+def classify(update) -> int:
+    if update.callback_query:
+        data = update.callback_query.data or ""
+        if data in LOW_VALUE_CALLBACKS:
+            return LOW
+        if data.startswith(PAYMENT_CALLBACK_PREFIXES):
+            return HIGH
+        return NORMAL
+    msg = update.message
+    if msg and (msg.photo or msg.document):
+        # чек оплаты (on_receipt)
+        return HIGH
+    return NORMAL
+
+def _user_id(update) -> Optional[int]:
+    event = update.callback_query or update.message
+    user = getattr(event, "from_user", None)
+    return user.id if user else None
+
+class AdmissionControl:
+    def __init__(self, max_inflight: int, max_queue: int, deadline: float,
+                 high_per_user: int, high_window: float, trusted: Iterable[int] = ()):
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self.deadline = deadline
+        self.high_per_user = high_per_user
+        self.high_window = high_window
+        self.trusted = set(trusted)
+        # user_id -> (начало окна, сколько HIGH выдано в окне)
+        self._high_used: Dict[int, Tuple[float, int]] = {}
+        self.demoted = 0
+        self.inflight = 0
+        self.queued = 0
+        self.max_queued = 0
+        self.admitted: Dict[int, int] = {p: 0 for p in PRIORITY_NAMES}
+        self.shed: Dict[int, int] = {p: 0 for p in PRIORITY_NAMES}
+        # (priority, seq, future); отменённые ожидания удаляются лениво
+        self._waiters: List[tuple] = []
+        self._seq = itertools.count()
+
+    async def __call__(self, handler, event, data):
+        priority = classify(event)
+        if priority == HIGH and not self._allow_high(_user_id(event)):
+            priority = NORMAL
+            self.demoted += 1
+        if not await self._acquire(priority):
+            self.shed[priority] += 1
+            await self._notify_shed(event, priority)
+            return None
+        self.admitted[priority] += 1
+        try:
+            return await handler(event, data)
+        finally:
+            self._release()
+
+    def _allow_high(self, user_id: Optional[int]) -> bool:
+        if user_id is None or user_id in self.trusted:
+            return True
+        now = time.monotonic()
+        if len(self._high_used) > 10_000:
+            # окна давно закрытые — забываем
+            self._high_used = {
+                k: v for k, v in self._high_used.items() if now - v[0] < self.high_window
+            }
+        started, used = self._high_used.get(user_id, (now, 0))
+        if now - started >= self.high_window:
+            started, used = now, 0
+        if used >= self.high_per_user:
+            return False
+        self._high_used[user_id] = (started, used + 1)
+        return True
+
+    async def _acquire(self, priority: int) -> bool:
+        if self.inflight < self.max_inflight and not self.queued:
+            self.inflight += 1
+            return True
+        if priority == LOW:
+            return False
+        if self.queued >= self.max_queue and not self._evict_lower(priority):
+            return False
+
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+        self.queued += 1
+        self.max_queued = max(self.max_queued, self.queued)
+        try:
+            # место передаёт _release (inflight уже увеличен), True/False — пустили/вытеснили
+            return await asyncio.wait_for(asyncio.shield(fut), self.deadline)
+        except asyncio.TimeoutError:
+            self._abandon(fut)
+            return False
+        except asyncio.CancelledError:
+            self._abandon(fut)
+            raise
+
+    def _abandon(self, fut: asyncio.Future):
+        if not fut.done():
+            fut.set_result(False)
+            self.queued -= 1
+        elif fut.result():
+            # место выдали одновременно с таймаутом — возвращаем его
+            self._release()
+
+    def _evict_lower(self, priority: int) -> bool:
+        # очередь полна: вытесняем самый поздний апдейт с приоритетом ниже нашего
+        victim = None
+        for item in self._waiters:
+            if not item[2].done() and item[0] > priority:
+                if victim is None or (item[0], item[1]) > (victim[0], victim[1]):
+                    victim = item
+        if victim is None:
+            return False
+        victim[2].set_result(False)
+        self.queued -= 1
+        return True
+
+    def _release(self):
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                self.queued -= 1
+                fut.set_result(True)
+                return
+        self.inflight -= 1
+
+    async def _notify_shed(self, update, priority: int):
+        try:
+            if update.callback_query:
+                if priority == LOW:
+                    # без текста: только чтобы кнопка не крутилась до таймаута Telegram
+                    await update.callback_query.answer()
+                else:
+                    await update.callback_query.answer("Бот перегружен, попробуйте через минуту 🙏")
+            elif update.message:
+                await update.message.answer(
+                    "⏳ Бот сейчас перегружен и не успел обработать сообщение.\n"
+                    "Отправьте его ещё раз через минуту."
+                )
+        except Exception:
+            pass
+
+    def metrics(self) -> Dict[str, int]:
+        m = {
+            "inflight": self.inflight,
+            "max_inflight": self.max_inflight,
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "demoted_high": self.demoted,
+        }
+        for p, name in PRIORITY_NAMES.items():
+            m[f"admitted_{name}"] = self.admitted[p]
+            m[f"shed_{name}"] = self.shed[p]
+        return m
@@ -0,0 +1,311 @@
+"""Микробенчмарк слоя данных (db.py).
+
+Создаёт синтетическую базу нужного размера и для каждой публичной функции
+db.py меряет ops/sec и перцентили задержки: одним вызывающим и несколькими
+одновременными. Результаты пишутся в JSON; с --baseline сравниваются с
+сохранённым прогоном, и при регрессии скрипт завершается с кодом 1.
+
+    python bench/bench_db.py --scale 100k --json bench-100k.json
+    python bench/bench_db.py --scale 100k --baseline bench-100k.json
+
+Заполнение базы на 1m занимает время — путь к базе можно сохранить (--db)
+и переиспользовать: уже заполненная база повторно не заполняется. Сама она
+не меняется: каждый прогон работает с её копией во временном каталоге, так
+что записи одного прогона не попадают в данные следующего.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from typing import Awaitable, Callable, Dict, List, Sequence
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import db  # noqa: E402
+
+SCALES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+SLUGS = ["math", "rus", "bio", "info", "hist", "soc", "chem", "phys", "oral"]
+DAY = 86400
+
+# -------- заполнение ----------
+
+def seed(path: str, users: int, purchases: int, chunk: int = 50_000):
+    rnd = random.Random(42)
+    now = int(time.time())
+    con = sqlite3.connect(path)
+    con.execute("BEGIN;")
+    for start in range(1, users + 1, chunk):
+        con.executemany(
+            "INSERT INTO users(user_id, username, first_name, created_at) VALUES(?, ?, ?, ?);",
+            ((i, f"user{i}", f"Имя {i}", now - rnd.randrange(365 * DAY))
+             for i in range(start, min(start + chunk, users + 1)))
+        )
+    con.executemany(
+        "INSERT INTO balances(user_id, balance) VALUES(?, ?);",
+        ((i, rnd.randrange(0, 2000)) for i in range(1, users + 1, 10))
+    )
+
+    statuses = ["approved"] * 16 + ["denied"] * 2 + ["canceled"] + ["pending"]
+    for start in range(1, purchases + 1, chunk):
+        rows, receipts, hashes = [], [], []
+        for pid in range(start, min(start + chunk, purchases + 1)):
+            created = now - rnd.randrange(365 * DAY)
+            status = rnd.choice(statuses)
+            slug = rnd.choice(SLUGS)
+            uid = rnd.randrange(1, users + 1)
+            has_receipt = status != "canceled"
+            rows.append((
+                pid, uid, slug, 349, status,
+                f"file{pid}" if has_receipt else None, f"uniq{pid}" if has_receipt else None,
+                1 if has_receipt else 0, created, created + rnd.randrange(DAY),
+                created + 60 if has_receipt else None,
+                f"{pid:064x}" if status == "approved" else None,
+            ))
+            if has_receipt:
+                receipts.append((f"uniq{pid}", pid, uid, created))
+                hashes.append((f"uniq{pid}", pid, uid, rnd.getrandbits(63), created))
+        con.executemany(f"INSERT INTO purchases({db.PURCHASE_COLUMNS}) VALUES({','.join('?' * 12)});", rows)
+        con.executemany(
+            "INSERT INTO used_receipts(receipt_unique_id, purchase_id, user_id, created_at) VALUES(?, ?, ?, ?);",
+            receipts
+        )
+        con.executemany(
+            "INSERT INTO receipt_hashes(receipt_unique_id, purchase_id, user_id, phash, created_at) VALUES(?, ?, ?, ?, ?);",
+            hashes
+        )
+    # агрегаты пересчитает init_db
+    con.execute("DELETE FROM daily_rollup;")
+    con.execute("DELETE FROM settings WHERE k IN ('rollup_backfilled', 'receipt_blobs_backfilled', 'ledger_opened');")
+    con.commit()
+    con.close()
+
+def pending_pool(path: str, needed: int, users: int) -> List[int]:
+    """Заявки в статусе pending для set_purchase_status: каждый вызов должен делать настоящий переход.
+    Посева (~5% pending) на все итерации не хватает — добиваем копию до needed, пока init_db ещё не считал агрегаты."""
+    rnd = random.Random(7)
+    now = int(time.time())
+    con = sqlite3.connect(path)
+    ids = [row[0] for row in con.execute("SELECT id FROM purchases WHERE status='pending' ORDER BY id;")]
+    if len(ids) < needed:
+        start = (con.execute("SELECT COALESCE(MAX(id), 0) FROM purchases;").fetchone()[0]) + 1
+        rows = []
+        for pid in range(start, start + needed - len(ids)):
+            created = now - rnd.randrange(DAY)
+            rows.append((
+                pid, rnd.randrange(1, users + 1), rnd.choice(SLUGS), 349, "pending",
+                f"file{pid}", f"uniq{pid}", 1, created, created, created + 60, None,
+            ))
+            ids.append(pid)
+        con.executemany(f"INSERT INTO purchases({db.PURCHASE_COLUMNS}) VALUES({','.join('?' * 12)});", rows)
+        con.commit()
+    con.close()
+    rnd.shuffle(ids)
+    return ids
+
+def copy_db(src: str, dst: str):
+    # backup API забирает и то, что ещё лежит в -wal
+    source, target = sqlite3.connect(src), sqlite3.connect(dst)
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+        target.close()
+
+# -------- замеры ----------
+
+def percentiles(lat: List[float]) -> Dict[str, float]:
+    if len(lat) < 2:
+        v = lat[0] * 1000 if lat else 0.0
+        return {"p50_ms": v, "p95_ms": v, "p99_ms": v}
+    q = statistics.quantiles(lat, n=100, method="inclusive")
+    return {"p50_ms": q[49] * 1000, "p95_ms": q[94] * 1000, "p99_ms": q[98] * 1000}
+
+async def measure(op: Callable[[random.Random], Awaitable], iterations: int, callers: int, max_seconds: float) -> Dict:
+    latencies: List[float] = []
+    deadline = time.perf_counter() + max_seconds
+    per_caller = max(1, iterations // callers)
+
+    async def caller(seed_: int):
+        rnd = random.Random(seed_)
+        for _ in range(per_caller):
+            if time.perf_counter() > deadline:
+                return
+            t = time.perf_counter()
+            await op(rnd)
+            latencies.append(time.perf_counter() - t)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(caller(i) for i in range(callers)))
+    elapsed = time.perf_counter() - started
+    result = {"calls": len(latencies), "ops_per_sec": len(latencies) / elapsed if elapsed else 0.0}
+    result.update(percentiles(latencies))
+    return {k: round(v, 3) if isinstance(v, float) else v for k, v in result.items()}
+
+def operations(users: int, purchases: int, pending_ids: Sequence[int] = ()) -> Dict[str, tuple]:
+    """name -> (функция от Random, доля от --iterations). Тяжёлые операции гоняются реже."""
+    now = int(time.time())
+    uid = lambda r: r.randrange(1, users + 1)  # noqa: E731
+    pid = lambda r: r.randrange(1, purchases + 1)  # noqa: E731
+    new_ids = iter(range(10 ** 12, 10 ** 13))
+    pending = iter(pending_ids)
+
+    return {
+        "upsert_user": (lambda r: db.upsert_user(uid(r), f"user{r.randrange(users)}", "Имя", now), 1.0),
+        "get_users_count": (lambda r: db.get_users_count(), 1.0),
+        "get_all_user_ids": (lambda r: db.get_all_user_ids(), 0.01),
+        "get_setting": (lambda r: db.get_setting("card_number"), 1.0),
+        "set_setting": (lambda r: db.set_setting("bench", str(r.random())), 1.0),
+        "get_card": (lambda r: db.get_card(), 1.0),
+        "add_balance": (lambda r: db.add_balance(uid(r), 10, now, reason="bench"), 1.0),
+        "pay_from_balance": (lambda r: db.pay_from_balance(uid(r), r.choice(SLUGS), 100, now), 1.0),
+        "has_pending_purchase": (lambda r: db.has_pending_purchase(uid(r)), 1.0),
+        "create_purchase": (lambda r: db.create_purchase(uid(r), r.choice(SLUGS), 349, now), 1.0),
+        "get_purchase": (lambda r: db.get_purchase(pid(r)), 1.0),
+        "attach_receipt": (lambda r: db.attach_receipt(pid(r), "file", f"bench{next(new_ids)}", now), 1.0),
+        "set_purchase_status": (lambda r: db.set_purchase_status(next(pending, None) or pid(r), r.choice(["approved", "denied"]), now), 1.0),
+        "get_latest_pending_purchase": (lambda r: db.get_latest_pending_purchase(uid(r)), 1.0),
+        "receipt_is_used": (lambda r: db.receipt_is_used(f"uniq{pid(r)}"), 1.0),
+        "mark_receipt_used": (lambda r: db.mark_receipt_used(f"bench{next(new_ids)}", pid(r), uid(r), now), 1.0),
+        "add_receipt_hash": (lambda r: db.add_receipt_hash(f"bench{next(new_ids)}", pid(r), uid(r), r.getrandbits(63), now), 1.0),
+        "get_receipt_hashes_tail": (lambda r: db.get_receipt_hashes(purchases - 100), 0.1),
+        "set_receipt_sha256": (lambda r: db.set_receipt_sha256(pid(r), "none", "0" * 64), 1.0),
+        "get_receipt_blobs": (lambda r: db.get_receipt_blobs(pid(r)), 1.0),
+        "mark_receipt_fetch_failed": (lambda r: db.mark_receipt_fetch_failed(f"uniq{pid(r)}"), 1.0),
+        "get_receipts_without_blob": (lambda r: db.get_receipts_without_blob(0, 100), 0.1),
+        "get_stats": (lambda r: db.get_stats(), 0.1),
+        "get_daily_stats": (lambda r: db.get_daily_stats(7), 0.1),
+        "find_user_id_by_username": (lambda r: db.find_user_id_by_username(f"@user{uid(r)}"), 1.0),
+        "search_users_by_username": (lambda r: db.search_users_by_username(f"@user{uid(r) // 100}"), 1.0),
+    }
+
+# -------- сравнение ----------
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    regressions = []
+    for name, modes in results["ops"].items():
+        for mode, cur in modes.items():
+            base = baseline.get("ops", {}).get(name, {}).get(mode)
+            if not base:
+                continue
+            if cur["ops_per_sec"] < base["ops_per_sec"] * (1 - tolerance):
+                regressions.append(
+                    f"{name} [{mode}]: ops/s {base['ops_per_sec']:.0f} -> {cur['ops_per_sec']:.0f}"
+                )
+            if cur["p95_ms"] > base["p95_ms"] * (1 + tolerance) and cur["p95_ms"] - base["p95_ms"] > 0.05:
+                regressions.append(
+                    f"{name} [{mode}]: p95 {base['p95_ms']:.2f} ms -> {cur['p95_ms']:.2f} ms"
+                )
+    return regressions
+
+async def run(args, workdir: str) -> Dict:
+    users = args.users or SCALES[args.scale]
+    purchases = args.purchases or users
+    db.CACHES = not args.no_caches
+
+    if not os.path.exists(args.db):
+        db.DB_PATH = args.db
+        await db.init_db()
+        t = time.perf_counter()
+        print(f"seeding {users} users, {purchases} purchases…", file=sys.stderr)
+        seed(args.db, users, purchases)
+        print(f"seeded in {time.perf_counter() - t:.1f} s", file=sys.stderr)
+
+    # операции записи меняют данные — меряем на копии, заполненная база остаётся как есть
+    db.DB_PATH = os.path.join(workdir, "bench.sqlite3")
+    db.ARCHIVE_DB_PATH = os.path.join(workdir, "bench_archive.sqlite3")
+    copy_db(args.db, db.DB_PATH)
+    # single + concurrent прогоны, у каждого до max(10, iterations) вызовов
+    pending_ids = pending_pool(db.DB_PATH, 2 * max(10, args.iterations), users)
+
+    # холодный старт на заполненной базе: схема, пересчёт агрегатов, кэши
+    bootstrap = await db.init_db()
+
+    ops = operations(users, purchases, pending_ids)
+    selected = args.only or list(ops)
+    results = {}
+    print(f"{'operation':<28} {'mode':<10} {'ops/s':>10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}", file=sys.stderr)
+    for name in selected:
+        op, share = ops[name]
+        iterations = max(10, int(args.iterations * share))
+        results[name] = {}
+        for mode, callers in (("single", 1), ("concurrent", args.concurrency)):
+            r = await measure(op, iterations, callers, args.max_seconds)
+            results[name][mode] = r
+            print(
+                f"{name:<28} {mode:<10} {r['ops_per_sec']:>10.0f} {r['p50_ms']:>8.2f} "
+                f"{r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f}",
+                file=sys.stderr
+            )
+
+    return {
+        "meta": {
+            "users": users,
+            "purchases": purchases,
+            "caches": db.CACHES,
+            "concurrency": args.concurrency,
+            "iterations": args.iterations,
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "timestamp": int(time.time()),
+            "bootstrap_ms": {k: round(v, 1) for k, v in bootstrap.items()},
+        },
+        "ops": results,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=SCALES, default="10k", help="число пользователей и заявок")
+    parser.add_argument("--users", type=int, help="вместо --scale")
+    parser.add_argument("--purchases", type=int, help="по умолчанию равно числу пользователей")
+    parser.add_argument("--db", help="путь к базе (по умолчанию временная)")
+    parser.add_argument("--iterations", type=int, default=2000, help="вызовов на операцию и режим")
+    parser.add_argument("--concurrency", type=int, default=16, help="одновременных вызывающих")
+    parser.add_argument("--max-seconds", type=float, default=10.0, help="ограничение времени на операцию и режим")
+    parser.add_argument("--only", nargs="+", help="только эти операции")
+    parser.add_argument("--no-caches", action="store_true", help="без кэшей в памяти, как у воркеров cluster.py")
+    parser.add_argument("--json", help="записать результаты в файл")
+    parser.add_argument("--baseline", help="сравнить с JSON прошлого прогона")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="допустимое ухудшение (доля)")
+    args = parser.parse_args()
+
+    if args.only:
+        unknown = set(args.only) - set(operations(1, 1))
+        if unknown:
+            parser.error(f"unknown operations: {', '.join(sorted(unknown))}")
+    tmp = tempfile.TemporaryDirectory()
+    if not args.db:
+        args.db = os.path.join(tmp.name, "seed.sqlite3")
+
+    results = asyncio.run(run(args, tmp.name))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+    tmp.cleanup()
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        meta = baseline.get("meta", {})
+        if meta.get("users") != results["meta"]["users"]:
+            print("warning: baseline was taken at a different scale", file=sys.stderr)
+        if meta.get("caches") != results["meta"]["caches"]:
+            print("warning: baseline was taken with different --no-caches", file=sys.stderr)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("\nregressions:", file=sys.stderr)
+            for line in regressions:
+                print(f"  {line}", file=sys.stderr)
+            sys.exit(1)
+        print("\nno regressions", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""Пропускная способность многопроцессного режима (cluster.py) на одной машине.
+
+Поднимает заглушку Bot API, запускает `python cluster.py` с WORKERS=N во
+временном каталоге (своя база) и шлёт в вебхук апдейты от множества
+пользователей: /start (запись в users + sendMessage) и переходы по меню
+(editMessageText + answerCallbackQuery). Апдейт считается обработанным, когда
+пришёл последний вызов Bot API его обработчика.
+
+    python bench/bench_workers.py --workers 1 2 4 --updates 5000 --users 500
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import tempfile
+import time
+
+from aiohttp import ClientSession, web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+class FakeBotAPI:
+    """Отвечает на методы Bot API и считает ответы бота пользователям."""
+
+    def __init__(self):
+        self.replies = 0
+        self.changed = asyncio.Event()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+        elif method in ("sendMessage", "editMessageText"):
+            result = {"message_id": 1, "date": 0, "chat": {"id": 1, "type": "private"}, "text": "ok"}
+        else:
+            result = True
+        # последний вызов обработчиков /start и buy_open
+        if method in ("sendMessage", "answerCallbackQuery"):
+            self.replies += 1
+            self.changed.set()
+        return web.json_response({"ok": True, "result": result})
+
+    async def wait_replies(self, n: int, timeout: float):
+        deadline = time.monotonic() + timeout
+        while self.replies < n:
+            self.changed.clear()
+            left = deadline - time.monotonic()
+            if left <= 0:
+                raise TimeoutError(f"got {self.replies} of {n} replies")
+            try:
+                await asyncio.wait_for(self.changed.wait(), left)
+            except asyncio.TimeoutError:
+                pass
+
+def make_update(update_id: int, user_id: int) -> dict:
+    user = {"id": user_id, "is_bot": False, "first_name": f"u{user_id}", "username": f"user{user_id}"}
+    chat = {"id": user_id, "type": "private"}
+    if update_id % 2:
+        return {"update_id": update_id, "message": {
+            "message_id": update_id, "date": 0, "chat": chat, "from": user, "text": "/start",
+        }}
+    return {"update_id": update_id, "callback_query": {
+        "id": str(update_id), "from": user, "chat_instance": "1", "data": "buy_open",
+        "message": {"message_id": 1, "date": 0, "chat": chat, "text": "menu"},
+    }}
+
+async def post_all(url: str, updates: list, concurrency: int):
+    queue = asyncio.Queue()
+    for u in updates:
+        queue.put_nowait(json.dumps(u))
+    async with ClientSession() as session:
+        async def poster():
+            while not queue.empty():
+                body = queue.get_nowait()
+                async with session.post(url, data=body, headers={"Content-Type": "application/json"}) as r:
+                    r.raise_for_status()
+        await asyncio.gather(*(poster() for _ in range(concurrency)))
+
+async def run_one(api: FakeBotAPI, api_port: int, workers: int, args) -> float:
+    port = free_port()
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            BOT_TOKEN="1:bench", ADMIN_ID="1", WORKERS=str(workers),
+            WEBHOOK_HOST="127.0.0.1", WEBHOOK_PORT=str(port), WEBHOOK_URL="",
+            TELEGRAM_API_URL=f"http://127.0.0.1:{api_port}",
+        )
+        # асинхронный процесс: заглушка Bot API живёт в этом же цикле событий
+        proc = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.join(ROOT, "cluster.py"), cwd=tmp, env=env,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=None if args.verbose else asyncio.subprocess.DEVNULL,
+        )
+        try:
+            url = f"http://127.0.0.1:{port}/webhook"
+            # прогрев: фронт слушает, все воркеры подняли базу и обработали апдейты
+            warmup = [make_update(2 * i + 1, 10_000_000 + i) for i in range(workers * 20)]
+            for _ in range(100):
+                try:
+                    base = api.replies
+                    await post_all(url, warmup, args.concurrency)
+                    break
+                except OSError:
+                    await asyncio.sleep(0.1)
+            await api.wait_replies(base + len(warmup), timeout=60)
+
+            updates = [make_update(i, 1000 + i % args.users) for i in range(args.updates)]
+            base = api.replies
+            started = time.perf_counter()
+            await post_all(url, updates, args.concurrency)
+            await api.wait_replies(base + len(updates), timeout=600)
+            return len(updates) / (time.perf_counter() - started)
+        finally:
+            proc.terminate()
+            await asyncio.wait_for(proc.wait(), 30)
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=64, help="одновременных POST в вебхук")
+    parser.add_argument("--json", help="записать результаты в файл")
+    parser.add_argument("--verbose", action="store_true", help="показывать лог бота")
+    args = parser.parse_args()
+
+    api = FakeBotAPI()
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", api.handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    api_port = free_port()
+    await web.TCPSite(runner, "127.0.0.1", api_port).start()
+
+    results = []
+    print(f"cpu: {os.cpu_count()}, updates: {args.updates}, users: {args.users}")
+    print(f"{'workers':>7} {'updates/s':>10} {'speedup':>8}")
+    for n in args.workers:
+        rate = await run_one(api, api_port, n, args)
+        results.append({"workers": n, "updates_per_sec": round(rate, 1)})
+        print(f"{n:>7} {rate:>10.1f} {rate / results[0]['updates_per_sec']:>7.2f}x")
+
+    await runner.cleanup()
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"cpu": os.cpu_count(), "updates": args.updates, "users": args.users, "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    asyncio.run(main())
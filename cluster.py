@@ -0,0 +1,196 @@
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from queue import Empty
+from typing import Callable, Dict, List, Tuple
+
+from aiohttp import web
+
+from config import CONFIG, WORKER_MAX_RESTARTS, WORKER_RESTART_WINDOW_SECONDS
+
+# Многопроцессный режим: один процесс принимает вебхук и раскладывает апдейты
+# по workers процессам по user_id. Все апдейты одного пользователя попадают
+# в один процесс и обрабатываются там по очереди, поэтому антифлуд, FSM и
+# прочее состояние в памяти процесса остаются согласованными. База общая (SQLite WAL).
+
+logger = logging.getLogger(__name__)
+
+def shard_key(update: dict) -> int:
+    # user_id автора апдейта; апдейты без пользователя — по chat_id, иначе в шард 0
+    for key, event in update.items():
+        if key == "update_id" or not isinstance(event, dict):
+            continue
+        user = event.get("from") or event.get("user")
+        if isinstance(user, dict) and "id" in user:
+            return int(user["id"])
+        chat = event.get("chat")
+        if isinstance(chat, dict) and "id" in chat:
+            return int(chat["id"])
+    return 0
+
+# -------- worker ----------
+
+def worker_main(index: int, queue, front_pid: int):
+    # остановкой управляет фронт: закрывает приём и присылает None в очередь
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    logging.basicConfig(level=logging.INFO, format=f"[worker {index}] %(name)s: %(message)s")
+    asyncio.run(_worker(index, queue, front_pid))
+
+async def _worker(index: int, queue, front_pid: int):
+    import db
+    import main
+
+    # настройки и пользователей меняют и другие процессы — читаем их из базы
+    db.CACHES = False
+    await main.warm_up()
+    if index == 0:
+        # фоновые задачи по всей базе — в одном процессе
+        main.spawn(main.retention_loop())
+        main.spawn(main.backfill_receipt_blobs())
+    logger.info("worker %d ready", index)
+
+    loop = asyncio.get_running_loop()
+    reader = ThreadPoolExecutor(max_workers=1)
+
+    def next_update():
+        while True:
+            try:
+                return queue.get(timeout=1.0)
+            except Empty:
+                if os.getppid() != front_pid:
+                    # фронт убит без штатной остановки — сиротой не остаёмся
+                    logger.warning("worker %d: front is gone, stopping", index)
+                    return None
+
+    # последняя задача по каждому пользователю: следующая ждёт её завершения
+    tails: Dict[int, asyncio.Task] = {}
+
+    async def feed(prev, update: dict):
+        if prev is not None:
+            await asyncio.wait([prev])
+        try:
+            await main.dp.feed_raw_update(main.bot, update)
+        except Exception:
+            logger.exception("update %s failed", update.get("update_id"))
+
+    def release(key: int, task: asyncio.Task):
+        if tails.get(key) is task:
+            del tails[key]
+
+    while True:
+        raw = await loop.run_in_executor(reader, next_update)
+        if raw is None:
+            break
+        update = json.loads(raw)
+        key = shard_key(update)
+        task = main.spawn(feed(tails.get(key), update))
+        tails[key] = task
+        task.add_done_callback(lambda t, k=key: release(k, t))
+
+    await asyncio.gather(*tails.values(), return_exceptions=True)
+    reader.shutdown(wait=False)
+    await main.bot.session.close()
+
+# -------- фронт ----------
+
+async def _front(workers: int, start_worker: Callable[[int], Tuple]) -> int:
+    import db
+    from main import bot
+
+    # схема и WAL — до запуска воркеров, чтобы они не соревновались за DDL;
+    # кэши фронту не нужны: обработчики он не выполняет
+    db.CACHES = False
+    await db.init_db()
+    queues, processes = [], []
+    for i in range(workers):
+        q, p = start_worker(i)
+        queues.append(q)
+        processes.append(p)
+
+    async def handle(request: web.Request) -> web.Response:
+        if CONFIG.webhook_secret and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != CONFIG.webhook_secret:
+            return web.Response(status=401)
+        raw = await request.read()
+        try:
+            update = json.loads(raw)
+        except ValueError:
+            return web.Response(status=400)
+        queues[shard_key(update) % len(queues)].put_nowait(raw)
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(CONFIG.webhook_path, handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, CONFIG.webhook_host, CONFIG.webhook_port).start()
+    logger.info(
+        "front: %d workers, listening on %s:%d%s",
+        len(processes), CONFIG.webhook_host, CONFIG.webhook_port, CONFIG.webhook_path
+    )
+
+    if CONFIG.webhook_url:
+        await bot.set_webhook(CONFIG.webhook_url, secret_token=CONFIG.webhook_secret or None)
+    await bot.session.close()
+
+    stop = asyncio.Event()
+    crashed = False
+
+    async def watchdog():
+        nonlocal crashed
+        restarts: List[float] = []
+        while not stop.is_set():
+            await asyncio.sleep(1)
+            for i, p in enumerate(processes):
+                if p.is_alive() or stop.is_set():
+                    continue
+                logger.error("front: worker %d exited with code %s", i, p.exitcode)
+                now = time.monotonic()
+                restarts = [t for t in restarts if now - t < WORKER_RESTART_WINDOW_SECONDS] + [now]
+                if len(restarts) > WORKER_MAX_RESTARTS:
+                    logger.error("front: workers keep crashing, shutting down")
+                    crashed = True
+                    stop.set()
+                    return
+                # новая очередь: упавший процесс мог оставить старую с захваченной блокировкой;
+                # апдейты, ждавшие в ней, теряются
+                queues[i], processes[i] = start_worker(i)
+                logger.info("front: worker %d restarted", i)
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    supervisor = asyncio.create_task(watchdog())
+    await stop.wait()
+    await supervisor
+
+    logger.info("front: stopping")
+    await runner.cleanup()
+    for q in queues:
+        q.put(None)
+    for p in processes:
+        await loop.run_in_executor(None, p.join)
+    return 1 if crashed else 0
+
+def run_cluster(workers: int):
+    ctx = multiprocessing.get_context("spawn")
+
+    def start_worker(index: int):
+        # daemon: при обычном завершении фронта воркеры не переживут его;
+        # при SIGKILL фронта воркер сам заметит смену родителя (см. _worker)
+        queue = ctx.Queue()
+        process = ctx.Process(target=worker_main, args=(index, queue, os.getpid()), name=f"bot-worker-{index}", daemon=True)
+        process.start()
+        return queue, process
+
+    sys.exit(asyncio.run(_front(workers, start_worker)))
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="[front] %(name)s: %(message)s")
+    run_cluster(max(CONFIG.workers, 1))
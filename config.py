@@ -9,11 +9,27 @@ class Config:
     token: str
     admin_id: int
     alt_pay_username: str
+    # Многопроцессный режим (cluster.py): webhook-фронт + workers процессов
+    workers: int
+    webhook_url: str  # публичный https-адрес вебхука; пусто — setWebhook не вызывается
+    webhook_host: str
+    webhook_port: int
+    webhook_path: str
+    webhook_secret: str
+    # Свой Bot API сервер (telegram-bot-api); пусто — api.telegram.org
+    api_url: str
 
 CONFIG = Config(
     token=os.getenv("BOT_TOKEN", "").strip(),
     admin_id=int(os.getenv("ADMIN_ID", "0")),
     alt_pay_username=os.getenv("ALT_PAY_USERNAME", "fepxu").strip().lstrip("@"),
+    workers=int(os.getenv("WORKERS", "1")),
+    webhook_url=os.getenv("WEBHOOK_URL", "").strip(),
+    webhook_host=os.getenv("WEBHOOK_HOST", "0.0.0.0").strip(),
+    webhook_port=int(os.getenv("WEBHOOK_PORT", "8080")),
+    webhook_path=os.getenv("WEBHOOK_PATH", "/webhook").strip(),
+    webhook_secret=os.getenv("WEBHOOK_SECRET", "").strip(),
+    api_url=os.getenv("TELEGRAM_API_URL", "").strip().rstrip("/"),
 )
 
 if not CONFIG.token or CONFIG.admin_id == 0:
@@ -38,3 +54,37 @@ RATE_LIMIT_SECONDS = 2
 
 # Антифрод: максимум чеков от пользователя на одну заявку
 MAX_RECEIPTS_PER_PURCHASE = 3
+
+# Антифрод: максимальное расстояние Хэмминга (из 64 бит), при котором чеки считаются похожими
+PHASH_MAX_DISTANCE = 6
+
+# Статистика по дням: сколько последних дней показывать в админке
+STATS_DAYS = 7
+
+# Архивация: завершённые заявки старше N дней переносятся в архивную базу
+ARCHIVE_AFTER_DAYS = 180
+# Антифрод: сколько дней хранить отпечатки чеков в основной базе
+RECEIPT_FINGERPRINT_DAYS = 365
+# Как часто запускать архивацию (часы)
+RETENTION_INTERVAL_HOURS = 24
+
+# Диагностика из админки: длительность снимка cProfile/tracemalloc (сек)
+PROFILE_SECONDS = 30
+
+# Контроль нагрузки: сколько апдейтов обрабатывать одновременно,
+# сколько держать в очереди и сколько секунд апдейт может ждать в ней
+MAX_INFLIGHT_UPDATES = 64
+ADMISSION_QUEUE_SIZE = 256
+ADMISSION_DEADLINE_SECONDS = 5
+# Приоритет платежей: не больше N апдейтов с чеком/кнопкой оплаты от пользователя за окно,
+# дальше — обычная очередь (админ без ограничений)
+ADMISSION_HIGH_PER_USER = 5
+ADMISSION_HIGH_WINDOW_SECONDS = 60
+
+# Локальный архив чеков: сколько чеков скачивать из Telegram одновременно
+RECEIPT_DOWNLOAD_CONCURRENCY = 4
+
+# Многопроцессный режим: упавший воркер перезапускается; если за окно
+# упало больше N раз — фронт останавливается (пусть перезапустит systemd/docker)
+WORKER_MAX_RESTARTS = 5
+WORKER_RESTART_WINDOW_SECONDS = 60
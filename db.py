@@ -1,10 +1,81 @@
+import asyncio
+import functools
+import os
+import random
+import sqlite3
+import time
+
 import aiosqlite
-from typing import Optional, Tuple, List, Dict
+from typing import Optional, Tuple, List, Dict, AsyncIterator
+
+from registry import UserRegistry, normalize_username
 
 DB_PATH = "bot.sqlite3"
+# Архив старых заявок и чеков (подключается через ATTACH только на время архивации)
+ARCHIVE_DB_PATH = "bot_archive.sqlite3"
+
+PURCHASE_COLUMNS = (
+    "id, user_id, product_slug, amount, status, receipt_file_id, receipt_file_unique_id, "
+    "receipt_count, created_at, updated_at, receipt_at, receipt_sha256"
+)
+
+# Таблицы, доступные для выгрузки админу (см. export.py)
+EXPORT_TABLES = ("users", "purchases", "used_receipts")
+
+# Несколько процессов (cluster.py) работают с одной базой в режиме WAL:
+# занятая база ждёт до BUSY_TIMEOUT сек, а запись, упавшая на блокировке, повторяется
+BUSY_TIMEOUT = 10.0
+LOCK_RETRIES = 5
+
+# Кэши настроек и пользователей; в многопроцессном режиме выключаются —
+# эти таблицы меняют и другие процессы
+CACHES = True
 
-async def init_db():
-    async with aiosqlite.connect(DB_PATH) as db:
+# Значения настроек, которые создаются при первом запуске
+DEFAULT_SETTINGS = {
+    "card_number": "0000 0000 0000 0000",
+    "card_owner": "ИМЯ ФАМИЛИЯ",
+}
+
+# Реестр пользователей в памяти (загружает init_db при CACHES); пока не загружен — запросы идут в SQLite
+users_registry = UserRegistry()
+# Кэш таблицы settings; None — не загружен, читаем из SQLite
+_settings: Optional[Dict[str, str]] = None
+
+def connect() -> aiosqlite.Connection:
+    return aiosqlite.connect(DB_PATH, timeout=BUSY_TIMEOUT)
+
+def retry_locked(func):
+    """Повторяет запись, если база занята другим процессом дольше BUSY_TIMEOUT
+    или транзакцию нельзя повысить до записи (устаревший снимок в WAL)."""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        for attempt in range(LOCK_RETRIES):
+            try:
+                return await func(*args, **kwargs)
+            except sqlite3.OperationalError as e:
+                message = str(e)
+                if attempt == LOCK_RETRIES - 1 or ("locked" not in message and "busy" not in message):
+                    raise
+            await asyncio.sleep(0.05 * 2 ** attempt + random.random() * 0.05)
+    return wrapper
+
+@retry_locked
+async def init_db() -> Dict[str, float]:
+    """Схема, значения по умолчанию и прогрев кэшей — одно подключение, одна транзакция.
+
+    Возвращает длительность фаз в миллисекундах.
+    """
+    timings = {}
+    started = time.perf_counter()
+    async with connect() as db:
+        # действует только на новой (пустой) базе; старые переводит full_vacuum по кнопке админа
+        await db.execute("PRAGMA auto_vacuum=INCREMENTAL;")
+        # WAL: читатели не блокируют писателя, несколько процессов делят одну базу
+        await db.execute("PRAGMA journal_mode=WAL;")
+        # IMMEDIATE: блокировку записи берём сразу и ждём её по busy_timeout —
+        # повышение чтения до записи посреди транзакции при гонке процессов сразу падает
+        await db.execute("BEGIN IMMEDIATE;")
         await db.execute("""
         CREATE TABLE IF NOT EXISTS users (
             user_id INTEGER PRIMARY KEY,
@@ -36,9 +107,15 @@ async def init_db():
             receipt_file_unique_id TEXT,
             receipt_count INTEGER NOT NULL DEFAULT 0,
             created_at INTEGER,
-            updated_at INTEGER
+            updated_at INTEGER,
+            receipt_at INTEGER, -- время последнего чека (для задержки чек -> решение)
+            receipt_sha256 TEXT -- файл последнего чека в локальном архиве (receipt_store.py)
         );
         """)
+        await _ensure_column(db, "purchases", "receipt_at", "INTEGER")
+        await _ensure_column(db, "purchases", "receipt_sha256", "TEXT")
+        # для выборки завершённых заявок на архивацию и подсчёта pending
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_purchases_status_updated ON purchases(status, updated_at);")
         # Антифрод: запрет повторного использования одного и того же file_unique_id
         await db.execute("""
         CREATE TABLE IF NOT EXISTS used_receipts (
@@ -48,10 +125,173 @@ async def init_db():
             created_at INTEGER
         );
         """)
+        # Локальный архив чеков: каждый присланный чек, не только последний по заявке;
+        # sha256 IS NULL — файл ещё не скачан (receipt_store.py)
+        await db.execute("""
+        CREATE TABLE IF NOT EXISTS receipt_blobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            receipt_unique_id TEXT UNIQUE NOT NULL,
+            purchase_id INTEGER NOT NULL,
+            user_id INTEGER,
+            file_id TEXT NOT NULL,
+            sha256 TEXT,
+            fetch_failed INTEGER NOT NULL DEFAULT 0, -- файла в Telegram больше нет, не пытаемся снова
+            created_at INTEGER
+        );
+        """)
+        await _ensure_column(db, "receipt_blobs", "fetch_failed", "INTEGER NOT NULL DEFAULT 0")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_receipt_blobs_purchase ON receipt_blobs(purchase_id, id);")
+        # Журнал изменений баланса (только добавление); balances — текущий снимок
+        await db.execute("""
+        CREATE TABLE IF NOT EXISTS balance_ledger (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            delta INTEGER NOT NULL,
+            balance_after INTEGER NOT NULL,
+            reason TEXT NOT NULL, -- admin/purchase/opening
+            purchase_id INTEGER,
+            actor_id INTEGER,
+            created_at INTEGER
+        );
+        """)
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_balance_ledger_user ON balance_ledger(user_id, id);")
+        # Антифрод: перцептивные хэши чеков для поиска похожих (пересохранённых/обрезанных) скринов
+        await db.execute("""
+        CREATE TABLE IF NOT EXISTS receipt_hashes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            receipt_unique_id TEXT UNIQUE,
+            purchase_id INTEGER,
+            user_id INTEGER,
+            phash INTEGER NOT NULL,
+            created_at INTEGER
+        );
+        """)
+        # Дневные агрегаты по товарам; обновляются при смене статуса, не пересчитываются
+        await db.execute("""
+        CREATE TABLE IF NOT EXISTS daily_rollup (
+            day TEXT NOT NULL, -- YYYY-MM-DD, локальное время сервера
+            product_slug TEXT NOT NULL,
+            created INTEGER NOT NULL DEFAULT 0,
+            approved INTEGER NOT NULL DEFAULT 0,
+            denied INTEGER NOT NULL DEFAULT 0,
+            canceled INTEGER NOT NULL DEFAULT 0,
+            revenue INTEGER NOT NULL DEFAULT 0,
+            latency_sum INTEGER NOT NULL DEFAULT 0, -- сумма секунд от чека до подтверждения
+            latency_n INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, product_slug)
+        ) WITHOUT ROWID;
+        """)
+        await _backfill_rollup(db)
+        await _open_ledger(db)
+        await _backfill_receipt_blobs(db)
+        await _seed_defaults(db)
+        timings["schema"] = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        if CACHES:
+            await _load_settings(db)
+            await _load_user_registry(db)
         await db.commit()
+        timings["caches"] = (time.perf_counter() - started) * 1000
+    return timings
+
+async def _seed_defaults(db):
+    # пустое значение тоже считается незаполненным
+    await db.executemany("""
+    INSERT INTO settings(k, v) VALUES(?, ?)
+    ON CONFLICT(k) DO UPDATE SET v=excluded.v WHERE COALESCE(settings.v, '')='';
+    """, list(DEFAULT_SETTINGS.items()))
 
+async def _load_settings(db):
+    global _settings
+    async with db.execute("SELECT k, v FROM settings;") as cur:
+        _settings = {r[0]: r[1] for r in await cur.fetchall()}
+
+async def _ensure_column(db, table: str, column: str, ddl: str, schema: str = "main"):
+    # простая миграция для баз, созданных до появления колонки
+    async with db.execute(f"PRAGMA {schema}.table_info({table});") as cur:
+        columns = {r[1] for r in await cur.fetchall()}
+    if column not in columns:
+        await db.execute(f"ALTER TABLE {schema}.{table} ADD COLUMN {column} {ddl};")
+
+async def _backfill_rollup(db):
+    # однократно заполняем агрегаты по уже существующим заявкам
+    async with db.execute("SELECT 1 FROM settings WHERE k='rollup_backfilled';") as cur:
+        if await cur.fetchone():
+            return
+    await db.execute("""
+    INSERT INTO daily_rollup(day, product_slug, created)
+    SELECT date(created_at, 'unixepoch', 'localtime'), product_slug, COUNT(*)
+    FROM purchases GROUP BY 1, 2;
+    """)
+    await db.execute("""
+    INSERT INTO daily_rollup(day, product_slug, approved, denied, canceled, revenue)
+    SELECT date(updated_at, 'unixepoch', 'localtime'), product_slug,
+           SUM(status='approved'), SUM(status='denied'), SUM(status='canceled'),
+           SUM(CASE WHEN status='approved' THEN amount ELSE 0 END)
+    FROM purchases WHERE status<>'pending' GROUP BY 1, 2
+    ON CONFLICT(day, product_slug) DO UPDATE SET
+      approved=approved+excluded.approved,
+      denied=denied+excluded.denied,
+      canceled=canceled+excluded.canceled,
+      revenue=revenue+excluded.revenue;
+    """)
+    await db.execute("INSERT INTO settings(k, v) VALUES('rollup_backfilled', '1');")
+
+async def _open_ledger(db):
+    # однократно: балансы, накопленные до появления журнала, — одной строкой 'opening',
+    # чтобы SUM(delta) по пользователю совпадал с balances.balance
+    async with db.execute("SELECT 1 FROM settings WHERE k='ledger_opened';") as cur:
+        if await cur.fetchone():
+            return
+    await db.execute("""
+    INSERT INTO balance_ledger(user_id, delta, balance_after, reason, created_at)
+    SELECT b.user_id, b.balance - COALESCE(l.total, 0), b.balance, 'opening', CAST(strftime('%s', 'now') AS INTEGER)
+    FROM balances b
+    LEFT JOIN (SELECT user_id, SUM(delta) AS total FROM balance_ledger GROUP BY user_id) l USING(user_id)
+    WHERE b.balance <> COALESCE(l.total, 0);
+    """)
+    await db.execute("INSERT INTO settings(k, v) VALUES('ledger_opened', '1');")
+
+async def _backfill_receipt_blobs(db):
+    # однократно: заявки до receipt_blobs — известен только последний чек (и его файл, если скачан)
+    async with db.execute("SELECT 1 FROM settings WHERE k='receipt_blobs_backfilled';") as cur:
+        if await cur.fetchone():
+            return
+    await db.execute("""
+    INSERT OR IGNORE INTO receipt_blobs(receipt_unique_id, purchase_id, user_id, file_id, sha256, created_at)
+    SELECT receipt_file_unique_id, id, user_id, receipt_file_id, receipt_sha256, COALESCE(receipt_at, updated_at)
+    FROM purchases WHERE receipt_file_id IS NOT NULL AND receipt_file_unique_id IS NOT NULL
+    ORDER BY id;
+    """)
+    await db.execute("INSERT INTO settings(k, v) VALUES('receipt_blobs_backfilled', '1');")
+
+async def _rollup_add(db, ts: int, product_slug: str, created: int = 0, approved: int = 0,
+                      denied: int = 0, canceled: int = 0, revenue: int = 0, latency: Optional[int] = None):
+    # вызывается внутри транзакции, которая меняет purchases
+    await db.execute("""
+    INSERT INTO daily_rollup(day, product_slug, created, approved, denied, canceled, revenue, latency_sum, latency_n)
+    VALUES(date(?, 'unixepoch', 'localtime'), ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(day, product_slug) DO UPDATE SET
+      created=created+excluded.created,
+      approved=approved+excluded.approved,
+      denied=denied+excluded.denied,
+      canceled=canceled+excluded.canceled,
+      revenue=revenue+excluded.revenue,
+      latency_sum=latency_sum+excluded.latency_sum,
+      latency_n=latency_n+excluded.latency_n;
+    """, (ts, product_slug, created, approved, denied, canceled, revenue,
+          latency or 0, 1 if latency is not None else 0))
+
+@retry_locked
 async def upsert_user(user_id: int, username: Optional[str], first_name: Optional[str], ts: int):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with connect() as db:
+        old_username = None
+        if users_registry.loaded:
+            # старое имя нужно реестру, чтобы убрать его из поиска
+            async with db.execute("SELECT username FROM users WHERE user_id=?;", (user_id,)) as cur:
+                row = await cur.fetchone()
+            old_username = row[0] if row else None
         await db.execute("""
         INSERT INTO users(user_id, username, first_name, created_at)
         VALUES(?, ?, ?, ?)
@@ -60,61 +300,105 @@ async def upsert_user(user_id: int, username: Optional[str], first_name: Optiona
           first_name=excluded.first_name;
         """, (user_id, username or "", first_name or "", ts))
         await db.commit()
+    if users_registry.loaded:
+        users_registry.upsert(user_id, username, old_username)
+
+async def _load_user_registry(db):
+    async with db.execute("SELECT user_id, username FROM users;") as cur:
+        users_registry.load([(int(r[0]), r[1]) for r in await cur.fetchall()])
 
 async def get_users_count() -> int:
-    async with aiosqlite.connect(DB_PATH) as db:
+    if users_registry.loaded:
+        return len(users_registry)
+    async with connect() as db:
         async with db.execute("SELECT COUNT(*) FROM users;") as cur:
             row = await cur.fetchone()
             return int(row[0])
 
 async def get_all_user_ids() -> List[int]:
-    async with aiosqlite.connect(DB_PATH) as db:
+    if users_registry.loaded:
+        return users_registry.user_ids()
+    async with connect() as db:
         async with db.execute("SELECT user_id FROM users;") as cur:
             rows = await cur.fetchall()
             return [int(r[0]) for r in rows]
 
 async def get_setting(k: str, default: str = "") -> str:
-    async with aiosqlite.connect(DB_PATH) as db:
+    if _settings is not None:
+        return _settings.get(k) or default
+    async with connect() as db:
         async with db.execute("SELECT v FROM settings WHERE k=?;", (k,)) as cur:
             row = await cur.fetchone()
             if not row:
                 return default
             return row[0] or default
 
+@retry_locked
 async def set_setting(k: str, v: str):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with connect() as db:
         await db.execute("""
         INSERT INTO settings(k, v) VALUES(?, ?)
         ON CONFLICT(k) DO UPDATE SET v=excluded.v;
         """, (k, v))
         await db.commit()
-
-async def ensure_default_card():
-    card = await get_setting("card_number", "")
-    owner = await get_setting("card_owner", "")
-    if not card:
-        await set_setting("card_number", "0000 0000 0000 0000")
-    if not owner:
-        await set_setting("card_owner", "ИМЯ ФАМИЛИЯ")
+    if _settings is not None:
+        _settings[k] = v
 
 async def get_card() -> Tuple[str, str]:
-    card = await get_setting("card_number", "0000 0000 0000 0000")
-    owner = await get_setting("card_owner", "ИМЯ ФАМИЛИЯ")
+    card = await get_setting("card_number", DEFAULT_SETTINGS["card_number"])
+    owner = await get_setting("card_owner", DEFAULT_SETTINGS["card_owner"])
     return card, owner
 
-async def add_balance(user_id: int, delta: int) -> int:
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("""
+@retry_locked
+async def add_balance(user_id: int, delta: int, ts: int, reason: str = "admin", actor_id: Optional[int] = None) -> int:
+    # снимок и запись в журнал — в одной транзакции
+    async with connect() as db:
+        async with db.execute("""
         INSERT INTO balances(user_id, balance) VALUES(?, ?)
-        ON CONFLICT(user_id) DO UPDATE SET balance=balance+excluded.balance;
-        """, (user_id, delta))
+        ON CONFLICT(user_id) DO UPDATE SET balance=balance+excluded.balance
+        RETURNING balance;
+        """, (user_id, delta)) as cur:
+            balance = int((await cur.fetchone())[0])
+        await db.execute("""
+        INSERT INTO balance_ledger(user_id, delta, balance_after, reason, actor_id, created_at)
+        VALUES(?, ?, ?, ?, ?, ?);
+        """, (user_id, delta, balance, reason, actor_id, ts))
         await db.commit()
-        async with db.execute("SELECT balance FROM balances WHERE user_id=?;", (user_id,)) as cur:
+        return balance
+
+@retry_locked
+async def pay_from_balance(user_id: int, product_slug: str, amount: int, ts: int) -> Optional[Tuple[int, int]]:
+    """Списывает amount и создаёт сразу подтверждённую покупку.
+
+    Возвращает (purchase_id, остаток) или None, если средств не хватает.
+    """
+    async with connect() as db:
+        await db.execute("BEGIN IMMEDIATE;")
+        async with db.execute("""
+        UPDATE balances SET balance=balance-?
+        WHERE user_id=? AND balance>=?
+        RETURNING balance;
+        """, (amount, user_id, amount)) as cur:
             row = await cur.fetchone()
-            return int(row[0]) if row else 0
+        if not row:
+            await db.rollback()
+            return None
+        balance = int(row[0])
+        cur = await db.execute("""
+        INSERT INTO purchases(user_id, product_slug, amount, status, created_at, updated_at)
+        VALUES(?, ?, ?, 'approved', ?, ?);
+        """, (user_id, product_slug, amount, ts, ts))
+        purchase_id = int(cur.lastrowid)
+        await _rollup_add(db, ts, product_slug, created=1, approved=1, revenue=amount)
+        await db.execute("""
+        INSERT INTO balance_ledger(user_id, delta, balance_after, reason, purchase_id, actor_id, created_at)
+        VALUES(?, ?, ?, 'purchase', ?, ?, ?);
+        """, (user_id, -amount, balance, purchase_id, user_id, ts))
+        await db.commit()
+        return purchase_id, balance
 
 async def has_pending_purchase(user_id: int) -> bool:
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with connect() as db:
         async with db.execute("""
         SELECT 1 FROM purchases
         WHERE user_id=? AND status='pending'
@@ -123,17 +407,19 @@ async def has_pending_purchase(user_id: int) -> bool:
             row = await cur.fetchone()
             return row is not None
 
+@retry_locked
 async def create_purchase(user_id: int, product_slug: str, amount: int, ts: int) -> int:
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with connect() as db:
         cur = await db.execute("""
         INSERT INTO purchases(user_id, product_slug, amount, status, created_at, updated_at)
         VALUES(?, ?, ?, 'pending', ?, ?);
         """, (user_id, product_slug, amount, ts, ts))
+        await _rollup_add(db, ts, product_slug, created=1)
         await db.commit()
         return int(cur.lastrowid)
 
 async def get_purchase(purchase_id: int) -> Optional[Dict]:
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with connect() as db:
         async with db.execute("""
         SELECT id, user_id, product_slug, amount, status,
                receipt_file_id, receipt_file_unique_id, receipt_count
@@ -153,22 +439,45 @@ async def get_purchase(purchase_id: int) -> Optional[Dict]:
                 "receipt_count": int(row[7]),
             }
 
-async def set_purchase_status(purchase_id: int, status: str, ts: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("UPDATE purchases SET status=?, updated_at=? WHERE id=?;", (status, ts, purchase_id))
+@retry_locked
+async def set_purchase_status(purchase_id: int, status: str, ts: int) -> bool:
+    """Переводит pending-заявку в итоговый статус. False — заявка уже не pending
+    (её успели подтвердить, отклонить или отменить), ничего не изменено."""
+    async with connect() as db:
+        async with db.execute("""
+        UPDATE purchases SET status=?, updated_at=?
+        WHERE id=? AND status='pending'
+        RETURNING product_slug, amount, receipt_at;
+        """, (status, ts, purchase_id)) as cur:
+            row = await cur.fetchone()
+        if not row:
+            return False
+        slug, amount, receipt_at = row
+        if status == "approved":
+            latency = ts - int(receipt_at) if receipt_at is not None else None
+            await _rollup_add(db, ts, slug, approved=1, revenue=int(amount), latency=latency)
+        else:
+            await _rollup_add(db, ts, slug, **{status: 1})
         await db.commit()
+        return True
 
+@retry_locked
 async def attach_receipt(purchase_id: int, receipt_file_id: str, receipt_unique_id: str, ts: int):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with connect() as db:
         await db.execute("""
         UPDATE purchases
-        SET receipt_file_id=?, receipt_file_unique_id=?, receipt_count=receipt_count+1, updated_at=?
+        SET receipt_file_id=?, receipt_file_unique_id=?, receipt_count=receipt_count+1,
+            updated_at=?, receipt_at=?
         WHERE id=?;
-        """, (receipt_file_id, receipt_unique_id, ts, purchase_id))
+        """, (receipt_file_id, receipt_unique_id, ts, ts, purchase_id))
+        await db.execute("""
+        INSERT OR IGNORE INTO receipt_blobs(receipt_unique_id, purchase_id, user_id, file_id, created_at)
+        SELECT ?, id, user_id, ?, ? FROM purchases WHERE id=?;
+        """, (receipt_unique_id, receipt_file_id, ts, purchase_id))
         await db.commit()
 
 async def get_latest_pending_purchase(user_id: int) -> Optional[Dict]:
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with connect() as db:
         async with db.execute("""
         SELECT id, product_slug, amount, status, receipt_file_id, receipt_file_unique_id, receipt_count
         FROM purchases
@@ -189,31 +498,101 @@ async def get_latest_pending_purchase(user_id: int) -> Optional[Dict]:
             }
 
 async def receipt_is_used(receipt_unique_id: str) -> bool:
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with connect() as db:
         async with db.execute("SELECT 1 FROM used_receipts WHERE receipt_unique_id=? LIMIT 1;", (receipt_unique_id,)) as cur:
             return (await cur.fetchone()) is not None
 
+@retry_locked
 async def mark_receipt_used(receipt_unique_id: str, purchase_id: int, user_id: int, ts: int):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with connect() as db:
         await db.execute("""
         INSERT OR IGNORE INTO used_receipts(receipt_unique_id, purchase_id, user_id, created_at)
         VALUES(?, ?, ?, ?);
         """, (receipt_unique_id, purchase_id, user_id, ts))
         await db.commit()
 
+@retry_locked
+async def add_receipt_hash(receipt_unique_id: str, purchase_id: int, user_id: int, phash: int, ts: int):
+    # phash хранится знаковым 64-битным (см. phash.to_signed)
+    async with connect() as db:
+        await db.execute("""
+        INSERT OR IGNORE INTO receipt_hashes(receipt_unique_id, purchase_id, user_id, phash, created_at)
+        VALUES(?, ?, ?, ?, ?);
+        """, (receipt_unique_id, purchase_id, user_id, phash, ts))
+        await db.commit()
+
+async def get_receipt_hashes(after_id: int = 0) -> List[Tuple[int, int, int, int]]:
+    # (id, phash, purchase_id, user_id) с id > after_id — индекс догружает новые хэши,
+    # в том числе добавленные другими процессами
+    async with connect() as db:
+        async with db.execute("""
+        SELECT id, phash, purchase_id, user_id FROM receipt_hashes
+        WHERE id > ? ORDER BY id;
+        """, (after_id,)) as cur:
+            rows = await cur.fetchall()
+            return [(int(r[0]), int(r[1]), int(r[2]), int(r[3])) for r in rows]
+
+@retry_locked
+async def set_receipt_sha256(purchase_id: int, receipt_unique_id: str, sha256: str):
+    async with connect() as db:
+        await db.execute("UPDATE receipt_blobs SET sha256=? WHERE receipt_unique_id=?;", (sha256, receipt_unique_id))
+        # в purchases — только если это всё ещё последний чек заявки (загрузки могут завершиться не по порядку)
+        await db.execute("""
+        UPDATE purchases SET receipt_sha256=?
+        WHERE id=? AND receipt_file_unique_id=?;
+        """, (sha256, purchase_id, receipt_unique_id))
+        await db.commit()
+
+async def mark_receipt_fetch_failed(receipt_unique_id: str):
+    async with connect() as db:
+        await db.execute("UPDATE receipt_blobs SET fetch_failed=1 WHERE receipt_unique_id=?;", (receipt_unique_id,))
+        await db.commit()
+
+async def get_receipts_without_blob(after_id: int, limit: int) -> List[Tuple[int, int, str, str, int, int]]:
+    # (id, purchase_id, file_id, file_unique_id, user_id, created_at) — чеки, ещё не скачанные в локальный архив
+    async with connect() as db:
+        async with db.execute("""
+        SELECT id, purchase_id, file_id, receipt_unique_id, user_id, created_at FROM receipt_blobs
+        WHERE id > ? AND sha256 IS NULL AND fetch_failed=0
+        ORDER BY id LIMIT ?;
+        """, (after_id, limit)) as cur:
+            return [(int(r[0]), int(r[1]), r[2], r[3], int(r[4] or 0), int(r[5] or 0)) for r in await cur.fetchall()]
+
+async def get_receipt_blobs(purchase_id: int) -> List[Tuple[str, int]]:
+    # (sha256, created_at) всех скачанных чеков заявки, от первого к последнему
+    async with connect() as db:
+        async with db.execute("""
+        SELECT sha256, created_at FROM receipt_blobs
+        WHERE purchase_id=? AND sha256 IS NOT NULL ORDER BY id;
+        """, (purchase_id,)) as cur:
+            rows = [(r[0], int(r[1] or 0)) for r in await cur.fetchall()]
+        if rows or not os.path.exists(ARCHIVE_DB_PATH):
+            return rows
+        # заявки, ушедшие в архив до появления receipt_blobs: только последний чек
+        await db.execute("ATTACH DATABASE ? AS archive;", (ARCHIVE_DB_PATH,))
+        try:
+            async with db.execute("""
+            SELECT receipt_sha256, receipt_at FROM archive.purchases
+            WHERE id=? AND receipt_sha256 IS NOT NULL;
+            """, (purchase_id,)) as cur:
+                row = await cur.fetchone()
+        except sqlite3.OperationalError:
+            # архив ещё без таблиц или без колонки receipt_sha256
+            row = None
+        return [(row[0], int(row[1] or 0))] if row else []
+
 async def get_stats() -> Dict[str, int]:
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute("SELECT COUNT(*) FROM purchases;") as cur:
-            purchases_total = int((await cur.fetchone())[0])
-        async with db.execute("SELECT COUNT(*) FROM purchases WHERE status='approved';") as cur:
-            approved = int((await cur.fetchone())[0])
+    # итоги берём из daily_rollup: заархивированные заявки в purchases уже не лежат
+    async with connect() as db:
+        async with db.execute("""
+        SELECT COALESCE(SUM(created),0), COALESCE(SUM(approved),0),
+               COALESCE(SUM(denied),0) + COALESCE(SUM(canceled),0), COALESCE(SUM(revenue),0)
+        FROM daily_rollup;
+        """) as cur:
+            purchases_total, approved, denied, revenue = (int(x) for x in await cur.fetchone())
         async with db.execute("SELECT COUNT(*) FROM purchases WHERE status='pending';") as cur:
             pending = int((await cur.fetchone())[0])
         # cancelled считаем как denied в общей статистике
-        async with db.execute("SELECT COUNT(*) FROM purchases WHERE status IN ('denied','canceled');") as cur:
-            denied = int((await cur.fetchone())[0])
-        async with db.execute("SELECT COALESCE(SUM(amount),0) FROM purchases WHERE status='approved';") as cur:
-            revenue = int((await cur.fetchone())[0])
         return {
             "purchases_total": purchases_total,
             "approved": approved,
@@ -222,11 +601,232 @@ async def get_stats() -> Dict[str, int]:
             "revenue": revenue,
         }
 
+async def get_daily_stats(days: int) -> Tuple[List[Dict], List[Dict]]:
+    """Агрегаты за последние days дней: (по дням, по товарам). Читает только daily_rollup."""
+    cols = """SUM(created), SUM(approved), SUM(denied), SUM(canceled), SUM(revenue),
+              SUM(latency_sum), SUM(latency_n)"""
+    since = (days - 1,)
+    async with connect() as db:
+        async with db.execute(f"""
+        SELECT day, {cols} FROM daily_rollup
+        WHERE day >= date('now', 'localtime', '-' || ? || ' days')
+        GROUP BY day ORDER BY day DESC;
+        """, since) as cur:
+            by_day = await cur.fetchall()
+        async with db.execute(f"""
+        SELECT product_slug, {cols} FROM daily_rollup
+        WHERE day >= date('now', 'localtime', '-' || ? || ' days')
+        GROUP BY product_slug ORDER BY SUM(revenue) DESC;
+        """, since) as cur:
+            by_product = await cur.fetchall()
+
+    def to_dict(key: str, r) -> Dict:
+        return {
+            key: r[0],
+            "created": int(r[1]),
+            "approved": int(r[2]),
+            "denied": int(r[3]),
+            "canceled": int(r[4]),
+            "revenue": int(r[5]),
+            "avg_latency": (int(r[6]) // int(r[7])) if r[7] else None,
+        }
+    return [to_dict("day", r) for r in by_day], [to_dict("product_slug", r) for r in by_product]
+
 async def find_user_id_by_username(username: str) -> Optional[int]:
-    username = username.lstrip("@").strip().lower()
+    username = normalize_username(username)
     if not username:
         return None
-    async with aiosqlite.connect(DB_PATH) as db:
+    if users_registry.loaded:
+        return users_registry.find(username)
+    async with connect() as db:
         async with db.execute("SELECT user_id FROM users WHERE lower(username)=? LIMIT 1;", (username,)) as cur:
             row = await cur.fetchone()
             return int(row[0]) if row else None
+
+async def search_users_by_username(prefix: str, limit: int = 5) -> List[Tuple[str, int]]:
+    # (username, user_id) по префиксу username — для подсказок в админке
+    prefix = normalize_username(prefix)
+    if not prefix:
+        return []
+    if users_registry.loaded:
+        return users_registry.search_prefix(prefix, limit)
+    pattern = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    async with connect() as db:
+        async with db.execute("""
+        SELECT lower(username), user_id FROM users
+        WHERE lower(username) LIKE ? ESCAPE '\\'
+        ORDER BY lower(username) LIMIT ?;
+        """, (pattern, limit)) as cur:
+            return [(r[0], int(r[1])) for r in await cur.fetchall()]
+
+async def iter_table(table: str, batch_size: int = 500) -> AsyncIterator[Tuple[List[str], List[tuple]]]:
+    # (колонки, строки) пачками по batch_size — курсор не вычитывается целиком
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"table is not exportable: {table}")
+    async with connect() as db:
+        async with db.execute(f"SELECT * FROM {table} ORDER BY rowid;") as cur:
+            columns = [c[0] for c in cur.description]
+            # первая пачка отдаётся даже пустой: колонки нужны и для пустой таблицы
+            rows = await cur.fetchmany(batch_size)
+            while True:
+                yield columns, rows
+                rows = await cur.fetchmany(batch_size)
+                if not rows:
+                    break
+
+# -------- архивация ----------
+
+async def _ensure_archive_schema(db):
+    await db.execute("""
+    CREATE TABLE IF NOT EXISTS archive.purchases (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        product_slug TEXT NOT NULL,
+        amount INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        receipt_file_id TEXT,
+        receipt_file_unique_id TEXT,
+        receipt_count INTEGER NOT NULL DEFAULT 0,
+        created_at INTEGER,
+        updated_at INTEGER,
+        receipt_at INTEGER,
+        receipt_sha256 TEXT,
+        archived_at INTEGER
+    );
+    """)
+    await _ensure_column(db, "purchases", "receipt_sha256", "TEXT", schema="archive")
+    await db.execute("""
+    CREATE TABLE IF NOT EXISTS archive.used_receipts (
+        receipt_unique_id TEXT PRIMARY KEY,
+        purchase_id INTEGER,
+        user_id INTEGER,
+        created_at INTEGER
+    );
+    """)
+    await db.commit()
+
+async def _db_size(db) -> int:
+    async with db.execute("PRAGMA page_count;") as cur:
+        pages = int((await cur.fetchone())[0])
+    async with db.execute("PRAGMA page_size;") as cur:
+        return pages * int((await cur.fetchone())[0])
+
+async def _move_batches(db, select_ids: str, params: tuple, batch_size: int,
+                        copy_sql: Optional[str], delete_sql: str) -> int:
+    """Переносит строки пачками; между пачками отдаём управление циклу событий.
+
+    select_ids выбирает до batch_size ключей, copy_sql и delete_sql выполняются
+    с ключами пачки (плейсхолдер {ids}). Копия в архив и удаление из основной
+    базы — две отдельные транзакции: при WAL транзакция на две базы (ATTACH)
+    не атомарна, а так при сбое строка в худшем случае останется в обеих базах.
+    delete_sql должен удалять только то, что уже есть в архиве.
+    """
+    moved = 0
+    while True:
+        await db.execute("BEGIN IMMEDIATE;")
+        async with db.execute(select_ids, params + (batch_size,)) as cur:
+            ids = [r[0] for r in await cur.fetchall()]
+        if not ids:
+            await db.rollback()
+            return moved
+        marks = ",".join("?" * len(ids))
+        if copy_sql:
+            # INSERT OR IGNORE: повторное копирование после сбоя ничего не ломает
+            await db.execute(copy_sql.format(ids=marks), ids)
+            await db.commit()
+            await db.execute("BEGIN IMMEDIATE;")
+        await db.execute(delete_sql.format(ids=marks), ids)
+        await db.commit()
+        moved += len(ids)
+        await asyncio.sleep(0)
+
+async def run_retention(archive_after_days: int, fingerprint_days: int, batch_size: int = 500) -> Dict[str, int]:
+    """Архивирует завершённые заявки старше archive_after_days и чистит старые отпечатки чеков.
+
+    В основной базе остаются pending, свежие заявки и отпечатки чеков моложе
+    fingerprint_days (их достаточно для антифрода). После переноса — incremental VACUUM,
+    если база уже в этом режиме; иначе full_vacuum_needed=1 и место не освобождается.
+    """
+    started = time.monotonic()
+    now = int(time.time())
+    purchases_cutoff = now - archive_after_days * 86400
+    fingerprint_cutoff = now - fingerprint_days * 86400
+
+    async with connect() as db:
+        bytes_before = await _db_size(db)
+        await db.execute("ATTACH DATABASE ? AS archive;", (ARCHIVE_DB_PATH,))
+        await _ensure_archive_schema(db)
+
+        purchases = await _move_batches(
+            db,
+            """SELECT id FROM main.purchases
+               WHERE status IN ('approved','denied','canceled') AND updated_at < ?
+               ORDER BY id LIMIT ?;""",
+            (purchases_cutoff,),
+            batch_size,
+            f"""INSERT OR IGNORE INTO archive.purchases({PURCHASE_COLUMNS}, archived_at)
+                SELECT {PURCHASE_COLUMNS}, {now} FROM main.purchases WHERE id IN ({{ids}});""",
+            """DELETE FROM main.purchases
+               WHERE id IN (SELECT id FROM archive.purchases WHERE id IN ({ids}));""",
+        )
+        # отпечатки: копия в архив, в основной базе — только моложе fingerprint_days
+        fingerprints = await _move_batches(
+            db,
+            "SELECT receipt_unique_id FROM main.used_receipts WHERE created_at < ? LIMIT ?;",
+            (fingerprint_cutoff,),
+            batch_size,
+            """INSERT OR IGNORE INTO archive.used_receipts
+               SELECT receipt_unique_id, purchase_id, user_id, created_at
+               FROM main.used_receipts WHERE receipt_unique_id IN ({ids});""",
+            """DELETE FROM main.used_receipts
+               WHERE receipt_unique_id IN (
+                 SELECT receipt_unique_id FROM archive.used_receipts WHERE receipt_unique_id IN ({ids})
+               );""",
+        )
+        hashes = await _move_batches(
+            db,
+            "SELECT id FROM main.receipt_hashes WHERE created_at < ? ORDER BY id LIMIT ?;",
+            (fingerprint_cutoff,),
+            batch_size,
+            None,
+            "DELETE FROM main.receipt_hashes WHERE id IN ({ids});",
+        )
+        await db.execute("DETACH DATABASE archive;")
+
+        # incremental_vacuum работает только при auto_vacuum=INCREMENTAL; старую базу
+        # переводит в этот режим полный VACUUM — его запускает админ отдельно (full_vacuum)
+        async with db.execute("PRAGMA auto_vacuum;") as cur:
+            full_vacuum_needed = int((await cur.fetchone())[0]) != 2
+        if not full_vacuum_needed:
+            # execute() делает один шаг (= одна страница); executescript прогоняет прагму до конца
+            await db.executescript("PRAGMA incremental_vacuum;")
+        bytes_after = await _db_size(db)
+
+    return {
+        "purchases": purchases,
+        "fingerprints": fingerprints,
+        "hashes": hashes,
+        "bytes_before": bytes_before,
+        "bytes_after": bytes_after,
+        "archive_bytes": os.path.getsize(ARCHIVE_DB_PATH) if os.path.exists(ARCHIVE_DB_PATH) else 0,
+        "seconds": round(time.monotonic() - started, 1),
+        "full_vacuum_needed": int(full_vacuum_needed),
+    }
+
+async def full_vacuum() -> Dict[str, int]:
+    """Разовый перевод базы в auto_vacuum=INCREMENTAL полным VACUUM.
+
+    Переписывает весь файл и всё это время держит блокировку записи: остальные
+    запросы (в том числе воркеров cluster.py) ждут и могут упасть по таймауту.
+    """
+    started = time.monotonic()
+    async with connect() as db:
+        bytes_before = await _db_size(db)
+        await db.execute("PRAGMA auto_vacuum=INCREMENTAL;")
+        await db.execute("VACUUM;")
+        bytes_after = await _db_size(db)
+    return {
+        "bytes_before": bytes_before,
+        "bytes_after": bytes_after,
+        "seconds": round(time.monotonic() - started, 1),
+    }
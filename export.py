@@ -0,0 +1,72 @@
+import csv
+import gzip
+import io
+import json
+import tempfile
+from typing import Tuple
+
+from aiogram.types import InputFile
+
+from db import iter_table
+
+# Выгрузка таблиц для админа. Строки читаются из курсора пачками (fetchmany)
+# и сразу пишутся во временный SpooledTemporaryFile: маленькие выгрузки
+# остаются в памяти, большие уходят на диск — весь результат в памяти не держим.
+
+EXPORT_FORMATS = ("csv", "jsonl")
+SPOOL_MAX_SIZE = 4 * 1024 * 1024
+BATCH_SIZE = 500
+
+class SpooledInputFile(InputFile):
+    """Отдаёт aiogram содержимое временного файла кусками, не читая его целиком."""
+
+    def __init__(self, spool, filename: str, chunk_size: int = 64 * 1024):
+        super().__init__(filename=filename, chunk_size=chunk_size)
+        self.spool = spool
+
+    async def read(self, bot):
+        self.spool.seek(0)
+        while chunk := self.spool.read(self.chunk_size):
+            yield chunk
+
+async def _write_csv(table: str, spool) -> int:
+    # каждая пачка кодируется отдельно и дописывается в spool байтами
+    rows_total = 0
+    header_written = False
+    async for columns, rows in iter_table(table, BATCH_SIZE):
+        buf = io.StringIO(newline="")
+        writer = csv.writer(buf)
+        if not header_written:
+            writer.writerow(columns)
+            header_written = True
+        writer.writerows(rows)
+        spool.write(buf.getvalue().encode("utf-8"))
+        rows_total += len(rows)
+    return rows_total
+
+async def _write_jsonl_gz(table: str, spool) -> int:
+    rows_total = 0
+    with gzip.GzipFile(filename=f"{table}.jsonl", mode="wb", fileobj=spool) as gz:
+        async for columns, rows in iter_table(table, BATCH_SIZE):
+            gz.write("".join(
+                json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n" for row in rows
+            ).encode("utf-8"))
+            rows_total += len(rows)
+    return rows_total
+
+async def export_table(table: str, fmt: str) -> Tuple[SpooledInputFile, int]:
+    """Возвращает (файл для send_document, число строк). Файл закрывается вызывающим."""
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    try:
+        if fmt == "csv":
+            rows = await _write_csv(table, spool)
+            filename = f"{table}.csv"
+        elif fmt == "jsonl":
+            rows = await _write_jsonl_gz(table, spool)
+            filename = f"{table}.jsonl.gz"
+        else:
+            raise ValueError(f"unknown export format: {fmt}")
+    except Exception:
+        spool.close()
+        raise
+    return SpooledInputFile(spool, filename), rows
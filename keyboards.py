@@ -32,10 +32,50 @@ def kb_admin() -> InlineKeyboardMarkup:
         [InlineKeyboardButton(text="📣 Рассылка", callback_data="admin_broadcast")],
         [InlineKeyboardButton(text="💳 Указать карту/ФИО", callback_data="admin_set_card")],
         [InlineKeyboardButton(text="💰 Выдать баланс", callback_data="admin_give_balance")],
-        [InlineKeyboardButton(text="📊 Статистика", callback_data="admin_stats")],
+        [
+            InlineKeyboardButton(text="📊 Статистика", callback_data="admin_stats"),
+            InlineKeyboardButton(text="📅 По дням", callback_data="admin_stats_days"),
+        ],
+        [
+            InlineKeyboardButton(text="📤 Экспорт данных", callback_data="admin_export"),
+            InlineKeyboardButton(text="🗄 Архивация", callback_data="admin_retention"),
+        ],
+        [InlineKeyboardButton(text="🩺 Диагностика", callback_data="admin_profiling")],
         [InlineKeyboardButton(text="⬅️ Назад", callback_data="start_back")],
     ])
 
+def kb_export_formats() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [
+            InlineKeyboardButton(text="CSV", callback_data="admin_export_csv"),
+            InlineKeyboardButton(text="JSONL (gzip)", callback_data="admin_export_jsonl"),
+        ],
+        [InlineKeyboardButton(text="⬅️ Назад", callback_data="admin_open")],
+    ])
+
+def kb_admin_profiling() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="⏱ Профиль CPU", callback_data="admin_prof_cpu")],
+        [InlineKeyboardButton(text="🧠 Аллокации памяти", callback_data="admin_prof_mem")],
+        [InlineKeyboardButton(text="📋 Задачи и апдейты", callback_data="admin_prof_tasks")],
+        [InlineKeyboardButton(text="📈 Нагрузка", callback_data="admin_prof_load")],
+        [InlineKeyboardButton(text="⬅️ Назад", callback_data="admin_open")],
+    ])
+
+def kb_retention_vacuum() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🧹 Сжать базу (полный VACUUM)", callback_data="admin_vacuum")],
+        [InlineKeyboardButton(text="⬅️ Назад", callback_data="admin_open")],
+    ])
+
+def kb_vacuum_confirm() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [
+            InlineKeyboardButton(text="✅ Запустить", callback_data="admin_vacuum_run"),
+            InlineKeyboardButton(text="❌ Отмена", callback_data="admin_open"),
+        ]
+    ])
+
 def kb_admin_review(purchase_id: int) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=[
         [
@@ -1,26 +1,48 @@
+import asyncio
+import logging
 import time
 from typing import Optional, Tuple
 
 from aiogram import Bot, Dispatcher, F
 from aiogram.enums import ParseMode
-from aiogram.types import Message, CallbackQuery
-from aiogram.filters import CommandStart
+from aiogram.types import Message, CallbackQuery, BufferedInputFile, FSInputFile
+from aiogram.filters import CommandStart, Command, CommandObject
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 from aiogram.client.default import DefaultBotProperties
-
-from config import CONFIG, PRODUCTS, RATE_LIMIT_SECONDS, MAX_RECEIPTS_PER_PURCHASE
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramBadRequest
+
+from config import (
+    CONFIG, PRODUCTS, RATE_LIMIT_SECONDS, MAX_RECEIPTS_PER_PURCHASE, PHASH_MAX_DISTANCE,
+    STATS_DAYS, ARCHIVE_AFTER_DAYS, RECEIPT_FINGERPRINT_DAYS, RETENTION_INTERVAL_HOURS,
+    PROFILE_SECONDS, MAX_INFLIGHT_UPDATES, ADMISSION_QUEUE_SIZE, ADMISSION_DEADLINE_SECONDS,
+    ADMISSION_HIGH_PER_USER, ADMISSION_HIGH_WINDOW_SECONDS,
+    RECEIPT_DOWNLOAD_CONCURRENCY
+)
 from db import (
-    init_db, upsert_user, ensure_default_card, get_card,
+    init_db, upsert_user, get_card,
     has_pending_purchase, create_purchase,
     get_latest_pending_purchase, attach_receipt,
     set_purchase_status, get_purchase, get_users_count, get_all_user_ids,
     get_stats, set_setting, find_user_id_by_username, add_balance,
-    receipt_is_used, mark_receipt_used
+    receipt_is_used, mark_receipt_used, add_receipt_hash, get_receipt_hashes,
+    search_users_by_username, pay_from_balance,
+    EXPORT_TABLES, get_daily_stats, run_retention, full_vacuum,
+    set_receipt_sha256, get_receipts_without_blob, get_receipt_blobs, mark_receipt_fetch_failed
 )
+from export import EXPORT_FORMATS, export_table
+from profiling import (
+    profiling_lock, track_inflight, capture_cpu_profile, capture_memory_snapshot, dump_tasks
+)
+from admission import AdmissionControl
+from phash import BKTree, dhash, to_signed, to_unsigned
+from receipt_store import DownloadPool, store_blob, blob_path, read_blob_head, guess_extension
 from keyboards import (
     kb_start, kb_subjects, kb_payment, kb_admin,
-    kb_admin_review, kb_broadcast_confirm
+    kb_admin_review, kb_broadcast_confirm, kb_export_formats, kb_admin_profiling,
+    kb_retention_vacuum, kb_vacuum_confirm
 )
 from texts import (
     start_text, buy_hint_text, payment_text, already_pending_text,
@@ -28,15 +50,62 @@ from texts import (
     access_denied_text, admin_panel_text, stats_text,
     card_updated_text, broadcast_intro_text, broadcast_confirm_text,
     broadcast_done_text, balance_prompt_user_text, balance_prompt_amount_text,
-    balance_done_text, receipt_reused_text, pending_canceled_text
+    balance_done_text, receipt_reused_text, pending_canceled_text,
+    balance_user_suggest_text, balance_paid_text,
+    export_intro_text, export_done_text, stats_days_text, retention_report_text,
+    profiling_intro_text, load_metrics_text, vacuum_confirm_text, vacuum_done_text
 )
 
+logger = logging.getLogger(__name__)
+_process_started = time.perf_counter()
+
 bot = Bot(
     CONFIG.token,
+    session=AiohttpSession(api=TelegramAPIServer.from_base(CONFIG.api_url)) if CONFIG.api_url else None,
     default=DefaultBotProperties(parse_mode=ParseMode.HTML)
 )
 dp = Dispatcher()
 
+# -------- готовность ----------
+# Polling стартует параллельно с прогревом; апдейты ждут, пока база и кэши не готовы
+_ready = asyncio.Event()
+
+def since_start_ms() -> float:
+    return (time.perf_counter() - _process_started) * 1000
+
+@dp.update.outer_middleware()
+async def wait_ready(handler, event, data):
+    if not _ready.is_set():
+        await _ready.wait()
+    return await handler(event, data)
+
+# -------- контроль нагрузки ----------
+admission = AdmissionControl(
+    MAX_INFLIGHT_UPDATES, ADMISSION_QUEUE_SIZE, ADMISSION_DEADLINE_SECONDS,
+    ADMISSION_HIGH_PER_USER, ADMISSION_HIGH_WINDOW_SECONDS, trusted=(CONFIG.admin_id,)
+)
+dp.update.outer_middleware(admission)
+# после admission: в «апдейтах в обработке» только реально запущенные, очередь — в admission.metrics()
+dp.update.outer_middleware(track_inflight)
+
+@dp.startup()
+async def on_startup():
+    logger.info("startup: polling started at %.0f ms", since_start_ms())
+
+async def warm_up():
+    started = time.perf_counter()
+    timings = await init_db()
+    t = time.perf_counter()
+    await load_receipt_index()
+    timings["receipt_index"] = (time.perf_counter() - t) * 1000
+    _ready.set()
+    receipt_pool.start()
+    logger.info(
+        "startup: ready at %.0f ms (warm-up %.0f ms: %s)",
+        since_start_ms(), (time.perf_counter() - started) * 1000,
+        ", ".join(f"{k} {v:.0f} ms" for k, v in timings.items())
+    )
+
 # -------- антифлуд (в памяти) ----------
 _last_action = {}
 def rate_limited(user_id: int) -> bool:
@@ -47,6 +116,128 @@ def rate_limited(user_id: int) -> bool:
     _last_action[user_id] = now
     return False
 
+# -------- антифрод: индекс перцептивных хэшей чеков ----------
+# payload: (purchase_id, user_id); перестраивается из SQLite при старте
+receipt_index = BKTree()
+_bg_tasks = set()
+
+def spawn(coro):
+    # держим ссылку на фоновую задачу, иначе её может собрать GC
+    task = asyncio.create_task(coro)
+    _bg_tasks.add(task)
+    task.add_done_callback(_bg_tasks.discard)
+    return task
+
+_receipt_index_last_id = 0
+
+async def load_receipt_index():
+    # строим новое дерево и подменяем целиком (после архивации старые хэши уходят)
+    global receipt_index, _receipt_index_last_id
+    index = BKTree()
+    last_id = 0
+    for row_id, h, purchase_id, user_id in await get_receipt_hashes():
+        index.add(to_unsigned(h), (purchase_id, user_id))
+        last_id = row_id
+    receipt_index, _receipt_index_last_id = index, last_id
+
+async def refresh_receipt_index():
+    # догружаем хэши, записанные после последней загрузки (в т.ч. другими процессами)
+    global _receipt_index_last_id
+    for row_id, h, purchase_id, user_id in await get_receipt_hashes(_receipt_index_last_id):
+        receipt_index.add(to_unsigned(h), (purchase_id, user_id))
+        _receipt_index_last_id = row_id
+
+# -------- локальный архив чеков ----------
+async def process_receipt(file_id: str, file_uid: str, purchase_id: int, user_id: int,
+                          admin_msg_id: Optional[int], alert_similar: bool = True,
+                          received_at: Optional[int] = None):
+    """Скачивает чек в локальный архив и сохраняет его dHash; для новых чеков
+    (alert_similar) ещё и сообщает админу о похожих."""
+    try:
+        data = (await bot.download(file_id)).getvalue()
+    except TelegramBadRequest as e:
+        # файл истёк или слишком большой — повторная попытка не поможет, backfill его больше не берёт
+        logger.warning("receipt %s of purchase #%s cannot be downloaded: %s", file_uid, purchase_id, e.message)
+        await mark_receipt_fetch_failed(file_uid)
+        return
+    sha256, _ = await asyncio.to_thread(store_blob, data)
+    await set_receipt_sha256(purchase_id, file_uid, sha256)
+    await check_receipt_similarity(data, file_uid, purchase_id, user_id, admin_msg_id, alert_similar, received_at)
+
+receipt_pool = DownloadPool(RECEIPT_DOWNLOAD_CONCURRENCY, process_receipt)
+_similarity_lock = asyncio.Lock()
+
+async def backfill_receipt_blobs(batch: int = 100):
+    # чеки, пришедшие до появления архива или не скачанные из-за ошибки
+    after_id = 0
+    while True:
+        rows = await get_receipts_without_blob(after_id, batch)
+        if not rows:
+            return
+        for row_id, purchase_id, file_id, file_uid, user_id, created_at in rows:
+            # старые чеки: хэш в индекс, но без уведомлений админу
+            receipt_pool.submit(file_id, file_uid, purchase_id, user_id, None, False, created_at or None)
+        after_id = rows[-1][0]
+        await receipt_pool.queue.join()
+
+async def check_receipt_similarity(data: bytes, file_uid: str, purchase_id: int, user_id: int,
+                                   admin_msg_id: Optional[int], alert: bool = True,
+                                   received_at: Optional[int] = None):
+    """Считает и сохраняет dHash чека; при alert ищет похожие чеки по другим заявкам."""
+    try:
+        h = await asyncio.to_thread(dhash, data)
+    except Exception:
+        # не картинка (например, PDF)
+        return
+
+    # поиск и запись под замком: чеки из пула проверяются параллельно и иначе не видят друг друга
+    async with _similarity_lock:
+        await refresh_receipt_index()
+        matches = [
+            (d, pid, uid) for d, (pid, uid) in receipt_index.find(h, PHASH_MAX_DISTANCE)
+            if pid != purchase_id
+        ] if alert else []
+        # в индекс хэш попадёт при следующем refresh_receipt_index вместе с чужими
+        await add_receipt_hash(file_uid, purchase_id, user_id, to_signed(h), ts=received_at or ts())
+
+    if not matches:
+        return
+    lines = [
+        f"• заявка <code>#{pid}</code>, user_id <code>{uid}</code>, расстояние <b>{d}</b>"
+        for d, pid, uid in matches[:5]
+    ]
+    try:
+        await bot.send_message(
+            CONFIG.admin_id,
+            "⚠️ <b>Похожий чек уже присылали</b>\n"
+            f"Заявка: <code>#{purchase_id}</code>, user_id: <code>{user_id}</code>\n\n"
+            + "\n".join(lines),
+            reply_to_message_id=admin_msg_id
+        )
+    except Exception:
+        pass
+
+# -------- архивация ----------
+_retention_lock = asyncio.Lock()
+
+async def retention() -> dict:
+    async with _retention_lock:
+        report = await run_retention(ARCHIVE_AFTER_DAYS, RECEIPT_FINGERPRINT_DAYS)
+        if report["hashes"]:
+            await load_receipt_index()
+        return report
+
+async def retention_loop():
+    while True:
+        await asyncio.sleep(RETENTION_INTERVAL_HOURS * 3600)
+        try:
+            report = await retention()
+        except Exception:
+            logger.exception("retention failed")
+            continue
+        if report["full_vacuum_needed"]:
+            logger.warning("retention: space not reclaimed, run the full VACUUM from the admin panel")
+
 def is_admin(user_id: int) -> bool:
     return user_id == CONFIG.admin_id
 
@@ -118,6 +309,29 @@ async def cb_buy_subject(call: CallbackQuery, state: FSMContext):
         await call.message.edit_text(already_pending_text(), reply_markup=kb_payment())
         return
 
+    # хватает баланса — списываем и выдаём доступ сразу, без чека и ручной проверки
+    paid = await pay_from_balance(call.from_user.id, slug, PRODUCTS[slug]["price"], ts=ts())
+    if paid:
+        purchase_id, balance = paid
+        await state.clear()
+        await call.message.edit_text(balance_paid_text(slug, balance))
+        await call.message.answer(access_granted_text(PRODUCTS[slug]["link"]))
+        await call.answer()
+        try:
+            uname = f"@{call.from_user.username}" if call.from_user.username else "(без username)"
+            await bot.send_message(
+                CONFIG.admin_id,
+                "💰 <b>Оплата с баланса</b>\n"
+                f"Пользователь: <b>{call.from_user.first_name}</b> {uname}\n"
+                f"user_id: <code>{call.from_user.id}</code>\n"
+                f"Заявка: <code>#{purchase_id}</code>\n"
+                f"Товар: <b>{PRODUCTS[slug]['name']}</b>\n"
+                f"Остаток: <b>{balance}</b>"
+            )
+        except Exception:
+            pass
+        return
+
     card_number, card_owner = await get_card()
     purchase_id = await create_purchase(
         user_id=call.from_user.id,
@@ -144,7 +358,10 @@ async def cb_cancel_pending(call: CallbackQuery, state: FSMContext):
         await call.answer("Нет активной заявки.", show_alert=True)
         return
 
-    await set_purchase_status(int(pending["id"]), "canceled", ts=ts())
+    if not await set_purchase_status(int(pending["id"]), "canceled", ts=ts()):
+        # админ успел обработать заявку раньше
+        await call.answer("Заявка уже обработана.", show_alert=True)
+        return
     await state.clear()
 
     # опционально уведомим админа, чтобы не искал эту заявку
@@ -232,8 +449,10 @@ async def on_receipt(message: Message, state: FSMContext):
         f"🔁 Попыток осталось: <b>{left}</b>"
     )
 
+    admin_msg_id = None
     try:
-        await bot.send_message(CONFIG.admin_id, admin_text, reply_markup=kb_admin_review(int(purchase_id)))
+        sent = await bot.send_message(CONFIG.admin_id, admin_text, reply_markup=kb_admin_review(int(purchase_id)))
+        admin_msg_id = sent.message_id
         if message.photo:
             await bot.send_photo(CONFIG.admin_id, file_id, caption=f"Чек по заявке #{purchase_id}")
         else:
@@ -241,6 +460,10 @@ async def on_receipt(message: Message, state: FSMContext):
     except Exception:
         pass
 
+    # в фоне: чек скачивается в локальный архив и проверяется на похожесть,
+    # о похожих админ узнает ответом на уведомление
+    receipt_pool.submit(file_id, file_uid, int(purchase_id), user.id, admin_msg_id)
+
     await message.answer(receipt_received_text())
 
 @dp.callback_query(F.data.startswith("admin_approve_"))
@@ -254,12 +477,11 @@ async def admin_approve(call: CallbackQuery):
     if not purchase:
         await call.answer("Заявка не найдена.", show_alert=True)
         return
-    if purchase["status"] != "pending":
+    # статус решает сам UPDATE: при двойном нажатии или гонке с отменой проходит только один
+    if not await set_purchase_status(purchase_id, "approved", ts=ts()):
         await call.answer("Заявка уже обработана.", show_alert=True)
         return
 
-    await set_purchase_status(purchase_id, "approved", ts=ts())
-
     user_id = purchase["user_id"]
     slug = purchase["product_slug"]
     link = PRODUCTS[slug]["link"]
@@ -283,12 +505,11 @@ async def admin_deny(call: CallbackQuery):
     if not purchase:
         await call.answer("Заявка не найдена.", show_alert=True)
         return
-    if purchase["status"] != "pending":
+    # статус решает сам UPDATE: при двойном нажатии или гонке с отменой проходит только один
+    if not await set_purchase_status(purchase_id, "denied", ts=ts()):
         await call.answer("Заявка уже обработана.", show_alert=True)
         return
 
-    await set_purchase_status(purchase_id, "denied", ts=ts())
-
     try:
         await bot.send_message(purchase["user_id"], access_denied_text())
     except Exception:
@@ -297,6 +518,31 @@ async def admin_deny(call: CallbackQuery):
     await call.message.edit_reply_markup(reply_markup=None)
     await call.answer("Отклонено ❌")
 
+@dp.message(Command("receipt"))
+async def admin_receipt(message: Message, command: CommandObject):
+    """Чеки заявки из локального архива: /receipt <номер заявки>."""
+    if not is_admin(message.from_user.id):
+        return
+    raw = (command.args or "").strip().lstrip("#")
+    if not raw.isdigit():
+        await message.answer("Использование: <code>/receipt 123</code> — номер заявки.")
+        return
+    purchase_id = int(raw)
+
+    blobs = [
+        (sha256, created_at, head) for sha256, created_at in await get_receipt_blobs(purchase_id)
+        if (head := read_blob_head(sha256)) is not None
+    ]
+    if not blobs:
+        await message.answer(f"Чека по заявке <code>#{purchase_id}</code> нет в локальном архиве.")
+        return
+    for n, (sha256, created_at, head) in enumerate(blobs, 1):
+        sent = time.strftime("%d.%m.%Y %H:%M", time.localtime(created_at)) if created_at else "—"
+        await message.answer_document(
+            FSInputFile(blob_path(sha256), filename=f"receipt-{purchase_id}-{n}{guess_extension(head)}"),
+            caption=f"Чек {n} из {len(blobs)} по заявке #{purchase_id}, прислан {sent}\nsha256: <code>{sha256}</code>"
+        )
+
 # -------- админка ----------
 @dp.callback_query(F.data == "admin_open")
 async def admin_open(call: CallbackQuery, state: FSMContext):
@@ -321,6 +567,140 @@ async def admin_stats(call: CallbackQuery):
     )
     await call.answer()
 
+@dp.callback_query(F.data == "admin_stats_days")
+async def admin_stats_days(call: CallbackQuery):
+    if not is_admin(call.from_user.id):
+        await call.answer("Нет доступа.", show_alert=True)
+        return
+
+    by_day, by_product = await get_daily_stats(STATS_DAYS)
+    await call.message.edit_text(stats_days_text(STATS_DAYS, by_day, by_product), reply_markup=kb_admin())
+    await call.answer()
+
+@dp.callback_query(F.data == "admin_retention")
+async def admin_retention(call: CallbackQuery):
+    if not is_admin(call.from_user.id):
+        await call.answer("Нет доступа.", show_alert=True)
+        return
+    if _retention_lock.locked():
+        await call.answer("Архивация уже идёт.", show_alert=True)
+        return
+
+    await call.answer("Запускаю архивацию…")
+    report = await retention()
+    await call.message.answer(
+        retention_report_text(report),
+        reply_markup=kb_retention_vacuum() if report["full_vacuum_needed"] else kb_admin()
+    )
+
+@dp.callback_query(F.data == "admin_vacuum")
+async def admin_vacuum(call: CallbackQuery):
+    if not is_admin(call.from_user.id):
+        await call.answer("Нет доступа.", show_alert=True)
+        return
+    await call.message.edit_text(vacuum_confirm_text(), reply_markup=kb_vacuum_confirm())
+    await call.answer()
+
+@dp.callback_query(F.data == "admin_vacuum_run")
+async def admin_vacuum_run(call: CallbackQuery):
+    if not is_admin(call.from_user.id):
+        await call.answer("Нет доступа.", show_alert=True)
+        return
+    if _retention_lock.locked():
+        await call.answer("Архивация или VACUUM уже идёт.", show_alert=True)
+        return
+
+    await call.answer("Запускаю VACUUM…")
+    await call.message.edit_reply_markup(reply_markup=None)
+    async with _retention_lock:
+        report = await full_vacuum()
+    await call.message.answer(vacuum_done_text(report), reply_markup=kb_admin())
+
+@dp.callback_query(F.data == "admin_profiling")
+async def admin_profiling(call: CallbackQuery):
+    if not is_admin(call.from_user.id):
+        await call.answer("Нет доступа.", show_alert=True)
+        return
+    await call.message.edit_text(profiling_intro_text(PROFILE_SECONDS), reply_markup=kb_admin_profiling())
+    await call.answer()
+
+@dp.callback_query(F.data.startswith("admin_prof_"))
+async def admin_profiling_run(call: CallbackQuery):
+    if not is_admin(call.from_user.id):
+        await call.answer("Нет доступа.", show_alert=True)
+        return
+    kind = call.data.replace("admin_prof_", "", 1)
+
+    if kind == "load":
+        await call.message.edit_text(load_metrics_text(admission.metrics()), reply_markup=kb_admin_profiling())
+        await call.answer()
+        return
+
+    if kind == "tasks":
+        await call.answer()
+        document = BufferedInputFile(dump_tasks(admission.metrics()), filename=f"tasks-{ts()}.txt")
+        await bot.send_document(call.from_user.id, document, caption="📋 Задачи asyncio")
+        return
+
+    if kind not in ("cpu", "mem"):
+        await call.answer("Неизвестная команда.", show_alert=True)
+        return
+    if profiling_lock.locked():
+        await call.answer("Снимок уже снимается, подождите.", show_alert=True)
+        return
+
+    await call.answer(f"Снимаю {PROFILE_SECONDS} с…")
+    async with profiling_lock:
+        if kind == "cpu":
+            data = await capture_cpu_profile(PROFILE_SECONDS)
+            document = BufferedInputFile(data, filename=f"cpu-{ts()}.txt")
+            caption = f"⏱ cProfile за {PROFILE_SECONDS} с"
+        else:
+            data = await capture_memory_snapshot(PROFILE_SECONDS)
+            document = BufferedInputFile(data, filename=f"memory-{ts()}.txt")
+            caption = f"🧠 tracemalloc за {PROFILE_SECONDS} с"
+    await bot.send_document(call.from_user.id, document, caption=caption)
+
+@dp.callback_query(F.data == "admin_export")
+async def admin_export(call: CallbackQuery):
+    if not is_admin(call.from_user.id):
+        await call.answer("Нет доступа.", show_alert=True)
+        return
+    await call.message.edit_text(export_intro_text(), reply_markup=kb_export_formats())
+    await call.answer()
+
+@dp.callback_query(F.data.startswith("admin_export_"))
+async def admin_export_run(call: CallbackQuery):
+    if not is_admin(call.from_user.id):
+        await call.answer("Нет доступа.", show_alert=True)
+        return
+    fmt = call.data.replace("admin_export_", "", 1)
+    if fmt not in EXPORT_FORMATS:
+        await call.answer("Неизвестный формат.", show_alert=True)
+        return
+
+    await call.answer("Готовлю выгрузку…")
+    started = time.monotonic()
+    rows_total = 0
+    for table in EXPORT_TABLES:
+        try:
+            document, rows = await export_table(table, fmt)
+        except Exception:
+            logger.exception("export of %s failed", table)
+            continue
+        try:
+            await bot.send_document(call.from_user.id, document, caption=f"{table}: {rows} строк")
+        except Exception:
+            logger.exception("sending export of %s failed", table)
+        finally:
+            document.spool.close()
+        rows_total += rows
+
+    await call.message.answer(
+        export_done_text(len(EXPORT_TABLES), rows_total, time.monotonic() - started),
+        reply_markup=kb_admin()
+    )
+
 @dp.callback_query(F.data == "admin_set_card")
 async def admin_set_card(call: CallbackQuery, state: FSMContext):
     if not is_admin(call.from_user.id):
@@ -436,6 +816,12 @@ async def admin_balance_user(message: Message, state: FSMContext):
     elif raw.startswith("@"):
         user_id = await find_user_id_by_username(raw)
 
+    if not user_id and raw.startswith("@"):
+        matches = await search_users_by_username(raw)
+        if matches:
+            await message.answer(balance_user_suggest_text(matches))
+            return
+
     if not user_id:
         await message.answer("Не нашёл. Отправьте <code>@username</code> (если он запускал бота) или <code>user_id</code>.")
         return
@@ -459,7 +845,7 @@ async def admin_balance_amount(message: Message, state: FSMContext):
 
     data = await state.get_data()
     user_id = int(data["target_user_id"])
-    new_balance = await add_balance(user_id, amount)
+    new_balance = await add_balance(user_id, amount, ts=ts(), reason="admin", actor_id=message.from_user.id)
     await state.clear()
 
     try:
@@ -471,10 +857,22 @@ async def admin_balance_amount(message: Message, state: FSMContext):
     await message.answer(balance_done_text(user_id, new_balance), reply_markup=kb_admin())
 
 async def main():
-    await init_db()
-    await ensure_default_card()
-    await dp.start_polling(bot)
+    # прогрев базы и кэшей идёт одновременно с подключением к Telegram
+    polling = asyncio.create_task(dp.start_polling(bot))
+    try:
+        await warm_up()
+    except Exception:
+        logger.exception("startup: warm-up failed")
+        polling.cancel()
+        raise
+    spawn(retention_loop())
+    spawn(backfill_receipt_blobs())
+    await polling
 
 if __name__ == "__main__":
-    import asyncio
-    asyncio.run(main())
+    logging.basicConfig(level=logging.INFO)
+    if CONFIG.workers > 1 or CONFIG.webhook_url:
+        from cluster import run_cluster
+        run_cluster(CONFIG.workers)
+    else:
+        asyncio.run(main())
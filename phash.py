@@ -0,0 +1,76 @@
+import io
+from typing import Any, List, Optional, Tuple
+
+from PIL import Image
+
+# Перцептивный хэш чеков (dHash) + BK-дерево для поиска похожих по Хэммингу.
+# Пересохранённый, пережатый или слегка обрезанный скрин даёт хэш
+# с маленьким расстоянием, в отличие от file_unique_id.
+
+HASH_SIZE = 8  # 8x8 = 64 бита
+
+def dhash(data: bytes) -> int:
+    with Image.open(io.BytesIO(data)) as img:
+        img = img.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS)
+        px = list(img.getdata())
+    h = 0
+    for row in range(HASH_SIZE):
+        base = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            h = (h << 1) | (px[base + col] > px[base + col + 1])
+    return h
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+# SQLite INTEGER знаковый, а хэш 64-битный беззнаковый
+def to_signed(h: int) -> int:
+    return h - (1 << 64) if h >= (1 << 63) else h
+
+def to_unsigned(h: int) -> int:
+    return h + (1 << 64) if h < 0 else h
+
+class BKTree:
+    """BK-дерево по метрике Хэмминга: поиск в радиусе r без полного перебора."""
+
+    def __init__(self):
+        # узел: [hash, [payload, ...], {distance: узел}]
+        self._root: Optional[list] = None
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, h: int, payload: Any):
+        self._size += 1
+        if self._root is None:
+            self._root = [h, [payload], {}]
+            return
+        node = self._root
+        while True:
+            d = hamming(h, node[0])
+            if d == 0:
+                node[1].append(payload)
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [h, [payload], {}]
+                return
+            node = child
+
+    def find(self, h: int, radius: int) -> List[Tuple[int, Any]]:
+        # возвращает [(distance, payload), ...] по возрастанию расстояния
+        if self._root is None:
+            return []
+        found = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            d = hamming(h, node[0])
+            if d <= radius:
+                found.extend((d, p) for p in node[1])
+            for cd, child in node[2].items():
+                if d - radius <= cd <= d + radius:
+                    stack.append(child)
+        found.sort(key=lambda x: x[0])
+        return found
@@ -0,0 +1,119 @@
+import asyncio
+import cProfile
+import io
+import pstats
+import time
+import tracemalloc
+from typing import Dict, Optional, Tuple
+
+from aiogram.types.update import UpdateTypeLookupError
+
+# Диагностика работающего бота по запросу из админки.
+# cProfile и tracemalloc включаются только на время снимка и сразу выключаются,
+# поэтому вне снимка накладных расходов нет. Постоянно ведётся только
+# словарь апдейтов в обработке (см. track_inflight) — одна вставка/удаление на апдейт.
+
+# только один снимок за раз: два профилировщика в одном потоке не уживаются
+profiling_lock = asyncio.Lock()
+
+# id(task) -> (monotonic старта, описание апдейта)
+_inflight: Dict[int, Tuple[float, str]] = {}
+
+def describe_update(update) -> str:
+    try:
+        event = update.event
+    except UpdateTypeLookupError:
+        # тип апдейта, неизвестный aiogram: сам диспетчер его пропустит с предупреждением
+        return f"unknown update {update.update_id}"
+    user = getattr(event, "from_user", None)
+    who = f"user {user.id}" if user else "-"
+    if update.event_type == "callback_query":
+        return f"callback {event.data!r} ({who})"
+    if update.event_type == "message":
+        if event.text and event.text.startswith("/"):
+            return f"command {event.text.split()[0]} ({who})"
+        return f"message {event.content_type} ({who})"
+    return f"{update.event_type} ({who})"
+
+async def track_inflight(handler, event, data):
+    # outer middleware на dp.update
+    key = id(asyncio.current_task())
+    _inflight[key] = (time.monotonic(), describe_update(event))
+    try:
+        return await handler(event, data)
+    finally:
+        _inflight.pop(key, None)
+
+async def capture_cpu_profile(seconds: int, top: int = 60) -> bytes:
+    """cProfile всего, что выполняет цикл событий, в течение seconds секунд."""
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.disable()
+
+    out = io.StringIO()
+    out.write(f"cProfile, {seconds} s, sorted by cumulative time\n\n")
+    stats = pstats.Stats(profiler, stream=out)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top)
+    out.write("\n\nsorted by own time\n\n")
+    stats.sort_stats(pstats.SortKey.TIME).print_stats(top)
+    return out.getvalue().encode("utf-8")
+
+async def capture_memory_snapshot(seconds: int, top: int = 40) -> bytes:
+    """Топ аллокаций, сделанных за seconds секунд (tracemalloc)."""
+    started_here = not tracemalloc.is_tracing()
+    if started_here:
+        tracemalloc.start(10)
+    try:
+        await asyncio.sleep(seconds)
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        if started_here:
+            tracemalloc.stop()
+
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ))
+    lines = [
+        f"tracemalloc, {seconds} s: traced {current / 1024:.1f} KiB, peak {peak / 1024:.1f} KiB",
+        "",
+        f"top {top} by line:",
+    ]
+    for stat in snapshot.statistics("lineno")[:top]:
+        lines.append(str(stat))
+    lines += ["", "top 5 by traceback:"]
+    for stat in snapshot.statistics("traceback")[:5]:
+        lines.append("")
+        lines.append(f"{stat.size / 1024:.1f} KiB in {stat.count} blocks")
+        lines.extend(stat.traceback.format())
+    return "\n".join(lines).encode("utf-8")
+
+def dump_tasks(metrics: Optional[Dict[str, int]] = None, top: int = 30) -> bytes:
+    """Задачи цикла событий, самые долгие апдейты в обработке и метрики нагрузки."""
+    now = time.monotonic()
+    tasks = asyncio.all_tasks()
+    lines = [f"asyncio tasks: {len(tasks)}", f"updates in flight: {len(_inflight)}", ""]
+    if metrics:
+        lines.append("admission control:")
+        lines.extend(f"  {k}: {v}" for k, v in metrics.items())
+        lines.append("")
+
+    lines.append("longest-running updates:")
+    for started, what in sorted(_inflight.values())[:top]:
+        lines.append(f"  {now - started:8.2f} s  {what}")
+
+    lines += ["", "tasks:"]
+    for task in sorted(tasks, key=lambda t: t.get_name()):
+        coro = task.get_coro()
+        name = getattr(coro, "__qualname__", repr(coro))
+        where = ""
+        stack = task.get_stack(limit=1)
+        if stack:
+            frame = stack[-1]
+            where = f" at {frame.f_code.co_filename}:{frame.f_lineno}"
+        lines.append(f"  {task.get_name()}: {name}{where}")
+    return "\n".join(lines).encode("utf-8")
@@ -0,0 +1,81 @@
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+from typing import Awaitable, Callable, Optional, Tuple
+
+# Локальный архив чеков, адресуемый содержимым: файл лежит в
+# RECEIPTS_DIR/ab/cd/<sha256>, одинаковые файлы хранятся один раз.
+# Скачивание из Telegram идёт в фоне через пул с ограниченным числом загрузок.
+
+RECEIPTS_DIR = "receipts"
+
+logger = logging.getLogger(__name__)
+
+def blob_path(sha256: str) -> str:
+    return os.path.join(RECEIPTS_DIR, sha256[:2], sha256[2:4], sha256)
+
+def store_blob(data: bytes) -> Tuple[str, bool]:
+    """Сохраняет файл, возвращает (sha256, записан_ли_новый)."""
+    sha256 = hashlib.sha256(data).hexdigest()
+    path = blob_path(sha256)
+    if os.path.exists(path):
+        return sha256, False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # пишем во временный файл рядом и переименовываем — без полузаписанных файлов
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    return sha256, True
+
+def read_blob_head(sha256: str, n: int = 8) -> Optional[bytes]:
+    path = blob_path(sha256)
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return f.read(n)
+
+def guess_extension(head: bytes) -> str:
+    if head.startswith(b"\xff\xd8"):
+        return ".jpg"
+    if head.startswith(b"\x89PNG"):
+        return ".png"
+    if head.startswith(b"%PDF"):
+        return ".pdf"
+    if head[:4] == b"RIFF":
+        return ".webp"
+    return ".bin"
+
+class DownloadPool:
+    """Очередь заданий и size воркеров: одновременно выполняется не больше size заданий."""
+
+    def __init__(self, size: int, handler: Callable[..., Awaitable[None]]):
+        self.size = size
+        self.handler = handler
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self._workers = []
+
+    def start(self):
+        if self._workers:
+            return
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.size)]
+
+    def submit(self, *args):
+        self.queue.put_nowait(args)
+
+    async def _worker(self):
+        while True:
+            args = await self.queue.get()
+            try:
+                await self.handler(*args)
+            except Exception:
+                logger.exception("receipt job %r failed", args)
+            finally:
+                self.queue.task_done()
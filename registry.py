@@ -0,0 +1,87 @@
+from array import array
+from bisect import bisect_left
+from heapq import merge
+from itertools import chain
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Реестр пользователей в памяти: счётчик и поиск по username без обращения к SQLite.
+# user_id хранятся в отсортированном array('q') (8 байт на пользователя),
+# username — в словаре нормализованное имя -> user_id плюс отсортированный
+# список имён для поиска по префиксу. Новые id и имена копятся в небольших
+# буферах и вливаются в отсортированные массивы при редком полном чтении
+# (рассылка, поиск по префиксу), так что upsert не сдвигает массив на n элементов.
+
+def normalize_username(username: Optional[str]) -> str:
+    return (username or "").strip().lstrip("@").lower()
+
+class UserRegistry:
+    def __init__(self):
+        self.loaded = False
+        self._ids = array("q")
+        self._new_ids: Set[int] = set()
+        self._by_name: Dict[str, int] = {}
+        # могут остаться устаревшие имена — при поиске сверяемся с _by_name
+        self._names: List[str] = []
+        self._new_names: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self._ids) + len(self._new_ids)
+
+    def load(self, rows: Iterable[Tuple[int, Optional[str]]]):
+        ids = array("q")
+        by_name: Dict[str, int] = {}
+        for user_id, username in rows:
+            ids.append(user_id)
+            name = normalize_username(username)
+            if name:
+                by_name[name] = user_id
+        self._ids = array("q", sorted(ids))
+        self._new_ids = set()
+        self._by_name = by_name
+        self._names = sorted(by_name)
+        self._new_names = []
+        self.loaded = True
+
+    def upsert(self, user_id: int, username: Optional[str], old_username: Optional[str] = None):
+        """old_username — имя пользователя до изменения (его знает только вызывающий)."""
+        if user_id not in self._new_ids:
+            i = bisect_left(self._ids, user_id)
+            if i == len(self._ids) or self._ids[i] != user_id:
+                self._new_ids.add(user_id)
+
+        name = normalize_username(username)
+        old = normalize_username(old_username)
+        if name == old:
+            return
+        if old and self._by_name.get(old) == user_id:
+            del self._by_name[old]
+        if name:
+            if name not in self._by_name:
+                self._new_names.append(name)
+            self._by_name[name] = user_id
+
+    def user_ids(self) -> List[int]:
+        if self._new_ids:
+            self._ids = array("q", sorted(chain(self._ids, self._new_ids)))
+            self._new_ids = set()
+        return self._ids.tolist()
+
+    def find(self, username: str) -> Optional[int]:
+        return self._by_name.get(normalize_username(username))
+
+    def search_prefix(self, prefix: str, limit: int = 5) -> List[Tuple[str, int]]:
+        prefix = normalize_username(prefix)
+        if not prefix:
+            return []
+        if self._new_names:
+            self._names = list(merge(self._names, sorted(self._new_names)))
+            self._new_names = []
+        out = []
+        i = bisect_left(self._names, prefix)
+        while i < len(self._names) and len(out) < limit and self._names[i].startswith(prefix):
+            name = self._names[i]
+            user_id = self._by_name.get(name)
+            if user_id is not None and (not out or out[-1][0] != name):
+                out.append((name, user_id))
+            i += 1
+        return out
@@ -78,7 +78,11 @@ def access_denied_text() -> str:
     )
 
 def admin_panel_text() -> str:
-    return "🛠 <b>Админка</b>\n\nВыберите действие:"
+    return (
+        "🛠 <b>Админка</b>\n\n"
+        "Чеки заявки из локального архива: <code>/receipt номер_заявки</code>\n\n"
+        "Выберите действие:"
+    )
 
 def stats_text(users: int, purchases_total: int, approved: int, pending: int, denied: int, revenue: int) -> str:
     conv = (approved / users * 100) if users else 0.0
@@ -135,3 +139,128 @@ def balance_done_text(user_id: int, new_balance: int) -> str:
         f"✅ Готово. Пользователь <code>{user_id}</code>.\n"
         f"Новый баланс: <b>{new_balance}</b>"
     )
+
+def balance_user_suggest_text(matches: list) -> str:
+    lines = "\n".join(f"• @{name} — <code>{user_id}</code>" for name, user_id in matches)
+    return (
+        "Точного совпадения нет. Возможно, вы имели в виду:\n\n"
+        f"{lines}\n\n"
+        "Отправьте нужный <code>@username</code> или <code>user_id</code>."
+    )
+
+def balance_paid_text(product_slug: str, balance: int) -> str:
+    p = PRODUCTS[product_slug]
+    return (
+        f"✅ <b>{p['name']}</b> оплачено с баланса: <b>{p['price']} ₽</b>\n"
+        f"Остаток на балансе: <b>{balance}</b>"
+    )
+
+def export_intro_text() -> str:
+    return (
+        "📤 <b>Экспорт данных</b>\n\n"
+        "Выгружу таблицы <b>users</b>, <b>purchases</b> и <b>used_receipts</b> отдельными файлами.\n"
+        "Выберите формат:"
+    )
+
+def export_done_text(files: int, rows: int, seconds: float) -> str:
+    return (
+        "✅ <b>Экспорт завершён</b>\n\n"
+        f"📄 Файлов: <b>{files}</b>\n"
+        f"🧮 Строк: <b>{rows}</b>\n"
+        f"⏱ Время: <b>{seconds:.1f} с</b>"
+    )
+
+def _fmt_latency(seconds) -> str:
+    if seconds is None:
+        return "—"
+    if seconds < 3600:
+        return f"{seconds // 60} мин"
+    return f"{seconds / 3600:.1f} ч"
+
+def stats_days_text(days: int, by_day: list, by_product: list) -> str:
+    if not by_day:
+        return f"📅 <b>Статистика за {days} дн.</b>\n\nЗа этот период заявок не было."
+    lines = [f"{'дата':<5} {'new':>4} {'ok':>4} {'no':>4} {'₽':>7}"]
+    for r in by_day:
+        lines.append(
+            f"{r['day'][5:]:<5} {r['created']:>4} {r['approved']:>4} "
+            f"{r['denied'] + r['canceled']:>4} {r['revenue']:>7}"
+        )
+    products = []
+    for r in by_product:
+        name = PRODUCTS[r["product_slug"]]["name"] if r["product_slug"] in PRODUCTS else r["product_slug"]
+        conv = (r["approved"] / r["created"] * 100) if r["created"] else 0.0
+        products.append(
+            f"• {name}: <b>{r['revenue']} ₽</b>, ✅ {r['approved']}/{r['created']} ({conv:.0f}%), "
+            f"⏱ {_fmt_latency(r['avg_latency'])}"
+        )
+    return (
+        f"📅 <b>Статистика за {days} дн.</b>\n\n"
+        "<pre>" + "\n".join(lines) + "</pre>\n"
+        "<b>По товарам</b> (выручка, подтверждено/создано, среднее время чек → подтверждение):\n"
+        + "\n".join(products)
+    )
+
+def _fmt_bytes(n: int) -> str:
+    for unit in ("Б", "КБ", "МБ"):
+        if abs(n) < 1024:
+            return f"{n:.0f} {unit}"
+        n /= 1024
+    return f"{n:.1f} ГБ"
+
+def retention_report_text(report: dict) -> str:
+    reclaimed = report["bytes_before"] - report["bytes_after"]
+    return (
+        "🗄 <b>Архивация завершена</b>\n\n"
+        f"🧾 Заявок в архив: <b>{report['purchases']}</b>\n"
+        f"🔖 Отпечатков чеков в архив: <b>{report['fingerprints']}</b>\n"
+        f"🖼 Хэшей чеков удалено: <b>{report['hashes']}</b>\n\n"
+        f"💾 База: <b>{_fmt_bytes(report['bytes_before'])}</b> → <b>{_fmt_bytes(report['bytes_after'])}</b>"
+        f" (освобождено {_fmt_bytes(reclaimed)})\n"
+        f"📦 Архив: <b>{_fmt_bytes(report['archive_bytes'])}</b>\n"
+        f"⏱ Время: <b>{report['seconds']} с</b>"
+        + (
+            "\n\n⚠️ Место на диске не освобождено: база создана до включения incremental VACUUM. "
+            "Нужно один раз сжать её полным VACUUM — кнопка ниже."
+            if report.get("full_vacuum_needed") else ""
+        )
+    )
+
+def vacuum_confirm_text() -> str:
+    return (
+        "🧹 <b>Полный VACUUM</b>\n\n"
+        "База будет переписана целиком и переведена в режим incremental VACUUM — "
+        "дальше архивация будет освобождать место сама.\n\n"
+        "⚠️ Пока идёт VACUUM, бот не сможет писать в базу: покупки и ответы могут "
+        "завершаться ошибкой. На большой базе это минуты. Запускайте в спокойное время."
+    )
+
+def vacuum_done_text(report: dict) -> str:
+    return (
+        "🧹 <b>VACUUM завершён</b>\n\n"
+        f"💾 База: <b>{_fmt_bytes(report['bytes_before'])}</b> → <b>{_fmt_bytes(report['bytes_after'])}</b>\n"
+        f"⏱ Время: <b>{report['seconds']} с</b>"
+    )
+
+def profiling_intro_text(seconds: int) -> str:
+    return (
+        "🩺 <b>Диагностика</b>\n\n"
+        f"⏱ <b>Профиль CPU</b> — cProfile цикла событий за {seconds} с\n"
+        f"🧠 <b>Аллокации</b> — топ выделений памяти за {seconds} с (tracemalloc)\n"
+        "📋 <b>Задачи</b> — задачи asyncio и самые долгие апдейты прямо сейчас\n\n"
+        "Результат придёт файлом. Вне снимка профилировщики выключены."
+    )
+
+def load_metrics_text(m: dict) -> str:
+    return (
+        "📈 <b>Нагрузка</b>\n\n"
+        f"⚙️ В обработке: <b>{m['inflight']}</b> из {m['max_inflight']}\n"
+        f"⏳ В очереди: <b>{m['queued']}</b> (максимум было {m['max_queued']})\n\n"
+        "<pre>"
+        f"{'':<8} {'принято':>8} {'сброшено':>9}\n"
+        f"{'платежи':<8} {m['admitted_high']:>8} {m['shed_high']:>9}\n"
+        f"{'обычные':<8} {m['admitted_normal']:>8} {m['shed_normal']:>9}\n"
+        f"{'меню':<8} {m['admitted_low']:>8} {m['shed_low']:>9}"
+        "</pre>\n"
+        f"⬇️ Понижено из платежей (лимит на пользователя): <b>{m['demoted_high']}</b>"
+    )